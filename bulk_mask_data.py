@@ -0,0 +1,273 @@
+"""
+Author: Hevo
+File  : bulk_mask_data.py
+
+Purpose:
+--------
+This script applies the masking of encoding_data.py to large exported files (JSONL or CSV)
+outside of a Hevo pipeline. The input file is memory-mapped and cut into chunks at record
+boundaries; each chunk is masked by a pool of worker processes that read it straight from the
+mapping, and the masked chunks are written to the output file in their original order as soon
+as they are ready. Only a few chunks per worker are in flight at a time, so memory use stays
+bounded however large the file is, and throughput grows with the number of cores.
+
+    python bulk_mask_data.py export.jsonl masked.jsonl --fields object_name,email
+    python bulk_mask_data.py export.csv masked.csv --fields email --workers 8
+
+Usage Documentation:
+--------------------
+https://docs.hevodata.com/pipelines/transformations/
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import argparse
+import csv
+import io
+import json
+import mmap
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from encoding_data import mask_data
+from instrumentation import span
+
+FIELDS = ['object_name']        # Fields to mask, same as transform() in encoding_data.py
+CHUNK_SIZE_MB = 8               # Approximate size of the chunks handed to the workers
+IN_FLIGHT_PER_WORKER = 2        # Chunks queued per worker; bounds the memory used by pending results
+
+# State of a worker process, set up once by _init_worker()
+_worker = {}
+
+
+def find_chunks(mm, start, chunk_size, quoted=False):
+    """
+    Cut a memory-mapped file into chunks that end on a record boundary.
+
+    Parameters:
+    -----------
+    mm : mmap.mmap
+        The mapped input file.
+    start : int
+        Offset of the first record.
+    chunk_size : int
+        Approximate chunk size in bytes; a chunk is extended to the end of its last record.
+    quoted : bool
+        True for CSV, where a newline inside a quoted field does not end the record.
+
+    Yields:
+    -------
+    tuple
+        (offset, length) of each chunk.
+    """
+    size = len(mm)
+    while start < size:
+        # Searching from at least start keeps every chunk non-empty, whatever the chunk size
+        end = mm.find(b'\n', min(start + max(chunk_size, 1), size) - 1)
+        end = size if end == -1 else end + 1
+        if quoted:
+            # Quotes are doubled inside quoted fields, so an odd count means the chunk ends mid-field
+            quotes = mm[start:end].count(b'"')
+            while quotes % 2 and end < size:
+                next_end = mm.find(b'\n', end)
+                next_end = size if next_end == -1 else next_end + 1
+                quotes += mm[end:next_end].count(b'"')
+                end = next_end
+        yield start, end - start
+        start = end
+
+
+def positive_int(value):
+    """
+    Parse a command line value that must be an integer of at least 1.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got '{value}'")
+    return number
+
+
+def _init_worker(path, file_format, fields, columns):
+    f = open(path, 'rb')
+    _worker.update(
+        file=f,
+        mm=mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ),
+        format=file_format,
+        fields=fields,
+        columns=columns,
+    )
+
+
+def mask_chunk(offset, length):
+    """
+    Mask one chunk of the input file. Runs in a worker process.
+
+    Parameters:
+    -----------
+    offset : int
+        Offset of the chunk in the input file.
+    length : int
+        Length of the chunk in bytes.
+
+    Returns:
+    --------
+    tuple
+        The masked chunk as bytes, and the number of records in it.
+    """
+    text = _worker['mm'][offset:offset + length].decode('utf-8')
+    if _worker['format'] == 'csv':
+        return _mask_csv(text, _worker['columns'])
+    return _mask_jsonl(text, _worker['fields'])
+
+
+def _mask_jsonl(text, fields):
+    # Split on '\n' only, like find_chunks(): JSON strings may hold raw U+2028, U+2029 or U+0085,
+    # which splitlines() would also break on
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    masked = []
+    records = 0
+    for line in lines:
+        if not line.strip():
+            masked.append(line)
+            continue
+        record = json.loads(line)
+        for field in fields:
+            if field in record:
+                record[field] = mask_data(record[field])
+        masked.append(json.dumps(record, ensure_ascii=False))
+        records += 1
+    return ('\n'.join(masked) + '\n').encode('utf-8') if masked else b'', records
+
+
+def _mask_csv(text, columns):
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    records = 0
+    for row in csv.reader(io.StringIO(text, newline='')):
+        for column in columns:
+            if column < len(row):
+                row[column] = mask_data(row[column])
+        writer.writerow(row)
+        records += 1
+    return output.getvalue().encode('utf-8'), records
+
+
+def detect_format(path):
+    """
+    Guess the file format from the file extension.
+
+    Parameters:
+    -----------
+    path : str
+        The input file path.
+
+    Returns:
+    --------
+    str
+        'csv' or 'jsonl'.
+    """
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def main(input_path, output_path, fields=None, file_format=None, workers=None, chunk_size=CHUNK_SIZE_MB << 20):
+    """
+    Mask the given fields of every record of a JSONL or CSV file.
+
+    Parameters:
+    -----------
+    input_path : str
+        The file to mask.
+    output_path : str
+        Where to write the masked file.
+    fields : list of str, optional
+        The fields (JSON keys or CSV columns) to mask. Defaults to FIELDS.
+    file_format : str, optional
+        'jsonl' or 'csv'. Guessed from the file extension when not given.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    chunk_size : int
+        Approximate chunk size in bytes, at least 1.
+
+    Returns:
+    --------
+    str
+        A summary of the run.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1 byte, got {chunk_size}")
+    if workers is not None and workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    fields = fields or FIELDS
+    file_format = file_format or detect_format(input_path)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    records = 0
+
+    with open(input_path, 'rb') as f, span('bulk_mask', format=file_format):
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            open(output_path, 'wb').close()
+            return f"{input_path} is empty, nothing to mask"
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            columns = []
+            if file_format == 'csv':
+                # The header is copied as is and tells which columns to mask
+                start = next(find_chunks(mm, 0, 1, quoted=True))[1]
+                header = next(csv.reader(io.StringIO(mm[:start].decode('utf-8'), newline='')))
+                missing = [field for field in fields if field not in header]
+                if missing:
+                    raise ValueError(f"Columns not found in {input_path}: {', '.join(missing)}")
+                columns = [header.index(field) for field in fields]
+
+            with open(output_path, 'wb') as out, \
+                    ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        initargs=(input_path, file_format, fields, columns)) as executor:
+                out.write(mm[:start])
+                pending = deque()
+                for offset, length in find_chunks(mm, start, chunk_size, quoted=file_format == 'csv'):
+                    pending.append(executor.submit(mask_chunk, offset, length))
+                    # Write finished chunks in order, keeping only a few in flight per worker
+                    while pending and (len(pending) >= workers * IN_FLIGHT_PER_WORKER or pending[0].done()):
+                        data, count = pending.popleft().result()
+                        out.write(data)
+                        records += count
+                while pending:
+                    data, count = pending.popleft().result()
+                    out.write(data)
+                    records += count
+        finally:
+            mm.close()
+
+    elapsed = time.perf_counter() - started
+    return (f"Masked {', '.join(fields)} in {records} records of {input_path} ({size / (1 << 20):.1f} MB) "
+            f"with {workers} workers in {elapsed:.1f} seconds, written to {output_path}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Mask fields of a large JSONL or CSV export with the encoding_data.py masking.")
+    arg_parser.add_argument('input', help="The JSONL or CSV file to mask")
+    arg_parser.add_argument('output', help="Where to write the masked file")
+    arg_parser.add_argument('--fields', help="Fields to mask, comma separated (default: %s)" % ','.join(FIELDS))
+    arg_parser.add_argument('--format', choices=['jsonl', 'csv'], help="File format, guessed from the extension by default")
+    arg_parser.add_argument('--workers', type=positive_int, help="Number of worker processes (default: number of CPUs)")
+    arg_parser.add_argument('--chunk-size', type=positive_int, default=CHUNK_SIZE_MB,
+                            help="Chunk size in MB (default: %(default)s)")
+    args = arg_parser.parse_args()
+
+    # Call main() through the importable module, so that the worker processes can find mask_chunk()
+    # under any start method, also when this script is run by magic_scripts.py
+    import bulk_mask_data
+    print(bulk_mask_data.main(args.input, args.output, args.fields.split(',') if args.fields else None,
+                              args.format, args.workers, args.chunk_size << 20))
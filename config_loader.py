@@ -0,0 +1,591 @@
+"""
+Author: Hevo
+File  : config_loader.py
+
+Purpose:
+--------
+This module loads the YAML or TOML configuration shared by the scripts in this repository, so that
+SMTP settings, recipients, Hevo region endpoints, timezones, pipeline lists and lag thresholds do not
+have to be edited into every script. The file is validated once and compiled into immutable lookup
+structures. Without a configuration file each script compiles its own constants the same way.
+
+Example (TOML, the YAML layout is identical):
+
+    slack_webhook_url = "https://hooks.slack.com/services/..."
+    timezones = { EDT = -4, EST = -5, IST = 5.5 }   # UTC offsets in hours
+
+    [smtp]
+    server = "smtp.gmail.com"
+    port = 587
+    user = "alerts@example.com"
+    password = "<your_password>"
+
+    [regions.us]                                    # One entry per (region, credential) target
+    token = "<REPLACE_WITH_YOUR_TOKEN>"             # api_url defaults to https://us.hevodata.com/api/public/v2.0
+    concurrency = 4                                 # Parallel requests and pooled connections, default 4
+    rate_limit = 10                                 # Requests per second, default unlimited
+    timeout = 30                                    # Seconds before a request is abandoned, default 30
+    breaker = { failure_rate = 0.5, min_calls = 5, reset_seconds = 30 }   # Per endpoint, shared by regions on one host
+
+    [regions.us-marketing]
+    region = "us"                                   # Hevo region, when the entry name is not the region
+    token = "<ANOTHER_ACCOUNT_TOKEN>"
+
+    [thresholds]                                    # Defaults for every pipeline
+    warning_minutes = 70
+    critical_minutes = 720
+
+    [recipients]
+    "to@email.com" = ["cc1@email.com", "cc2@email.com"]
+
+    [[pipelines]]                                   # Pipeline IDs are per account, so a pipeline is its (region, id)
+    id = 683
+    region = "us"                                   # Optional when only one region is configured
+    warning_minutes = 30                            # Optional per-pipeline overrides
+    critical_minutes = 240
+    owners = ["to@email.com"]                       # Only these recipients are notified, default is all
+
+    [[restart]]                                     # A single [restart] table works too
+    pipeline_id = 683
+    objects = ["employees.students"]
+
+    [[models]]                                      # A single [models] table works too
+    region = "us-marketing"
+    ids = [123, 456]
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from types import MappingProxyType
+from urllib.parse import urlsplit
+
+DEFAULT_API_URL = 'https://{region}.hevodata.com/api/public/v2.0'
+DEFAULT_WARNING_MINUTES = 70
+DEFAULT_CRITICAL_MINUTES = 12 * 60
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 30.0
+
+
+class ConfigError(ValueError):
+    """
+    Raised when a configuration file cannot be read or fails validation.
+    """
+
+
+@dataclass(frozen=True)
+class SmtpSettings:
+    server: str
+    port: int
+    user: str
+    password: str
+
+
+@dataclass(frozen=True)
+class BreakerSettings:
+    failure_rate: float = 0.5       # Share of failed calls in the window that opens the circuit
+    min_calls: int = 5              # Calls needed in the window before the failure rate is judged
+    window: int = 20                # Number of recent calls considered
+    reset_seconds: float = 30.0     # Time the circuit stays open before a half-open probe
+
+
+@dataclass(frozen=True)
+class Region:
+    name: str
+    api_url: str
+    headers: MappingProxyType
+    concurrency: int = DEFAULT_CONCURRENCY
+    rate_limit: float = None
+    timeout: float = DEFAULT_TIMEOUT
+    breaker: BreakerSettings = BreakerSettings()
+
+
+@dataclass(frozen=True)
+class RestartTarget:
+    region: str
+    pipeline_id: int
+    objects: tuple
+
+
+@dataclass(frozen=True)
+class ModelTarget:
+    region: str
+    ids: tuple
+
+
+@dataclass(frozen=True)
+class PipelineSettings:
+    id: int
+    region: str
+    warning_lag: timedelta
+    critical_lag: timedelta
+    owners: tuple = ()
+
+
+@dataclass(frozen=True)
+class Config:
+    smtp: SmtpSettings
+    regions: MappingProxyType
+    recipients: MappingProxyType
+    tzinfos: MappingProxyType
+    pipelines: MappingProxyType
+    default_region: str
+    warning_lag: timedelta
+    critical_lag: timedelta
+    routes: MappingProxyType
+    slack_webhook_url: str = None
+    restarts: tuple = ()
+    model_targets: tuple = ()
+    source: str = None
+
+    def pipeline(self, pipeline_id, region=None):
+        """
+        Return the settings of a pipeline, falling back to the defaults for unlisted pipelines.
+
+        Parameters:
+        -----------
+        pipeline_id : int
+            The ID of the pipeline.
+        region : str, optional
+            The region entry the pipeline belongs to, defaults to the default region.
+
+        Returns:
+        --------
+        PipelineSettings
+            The pipeline's region and lag thresholds.
+        """
+        region = region or self.default_region
+        settings = self.pipelines.get((region, pipeline_id))
+        if settings is None:
+            settings = PipelineSettings(pipeline_id, region, self.warning_lag, self.critical_lag)
+        return settings
+
+    def region(self, name=None):
+        """
+        Return a region by name, or the default region.
+
+        Parameters:
+        -----------
+        name : str, optional
+            The region name.
+
+        Returns:
+        --------
+        Region
+            The region endpoint and request headers.
+        """
+        return self.regions[name or self.default_region]
+
+    def recipients_for(self, pipeline_id, region=None):
+        """
+        Return the primary recipients to notify about a pipeline.
+
+        Parameters:
+        -----------
+        pipeline_id : int
+            The ID of the pipeline.
+        region : str, optional
+            The region entry the pipeline belongs to, defaults to the default region.
+
+        Returns:
+        --------
+        tuple of str
+            The pipeline's owners, or every recipient if it has none.
+        """
+        routes = self.routes.get((region or self.default_region, pipeline_id))
+        return routes if routes is not None else self.routes.get(None, ())
+
+
+def read_config_file(path):
+    """
+    Parse a YAML or TOML file into plain Python data, based on the file extension.
+
+    Parameters:
+    -----------
+    path : str
+        Path of the configuration file.
+
+    Returns:
+    --------
+    dict
+        The parsed configuration.
+
+    Raises:
+    -------
+    ConfigError
+        If the file cannot be read or parsed.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == '.toml':
+            import tomllib
+            with open(path, 'rb') as f:
+                return tomllib.load(f)
+        if extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ConfigError("PyYAML is required for YAML configuration files (pip install pyyaml)")
+            with open(path) as f:
+                return yaml.safe_load(f) or {}
+    except ConfigError:
+        raise
+    except Exception as e:
+        raise ConfigError(f"Could not read configuration file {path}: {e}")
+    raise ConfigError(f"Unsupported configuration file type '{extension}', use .toml, .yaml or .yml")
+
+
+def load_config(path):
+    """
+    Read, validate and compile a configuration file.
+
+    Parameters:
+    -----------
+    path : str
+        Path of the YAML or TOML configuration file.
+
+    Returns:
+    --------
+    Config
+        The compiled configuration.
+    """
+    return compile_config(read_config_file(path), source=path)
+
+
+def _minutes(value, name, errors):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        errors.append(f"{name} must be a positive number of minutes")
+        return None
+    return timedelta(minutes=value)
+
+
+def _string_list(value, name, errors):
+    if isinstance(value, str) or not isinstance(value, (list, tuple)) or \
+            not all(isinstance(item, str) for item in value):
+        errors.append(f"{name} must be a list of strings")
+        return ()
+    return tuple(value)
+
+
+def _id_list(value, name, errors):
+    if not isinstance(value, (list, tuple)) or \
+            not all(isinstance(item, int) and not isinstance(item, bool) for item in value):
+        errors.append(f"{name} must be a list of integer IDs")
+        return ()
+    return tuple(value)
+
+
+def _compile_regions(raw_regions, errors):
+    regions = {}
+    if not isinstance(raw_regions, dict) or not raw_regions:
+        errors.append("regions must map at least one region name to its token")
+        return regions
+
+    for name, raw in raw_regions.items():
+        if not isinstance(raw, dict):
+            errors.append(f"regions.{name} must be a table")
+            continue
+        if 'headers' in raw:
+            if not isinstance(raw['headers'], dict):
+                errors.append(f"regions.{name}.headers must be a table")
+                continue
+            region_headers = dict(raw['headers'])
+        elif 'token' in raw:
+            region_headers = {'accept': 'application/json', 'authorization': f"Basic {raw['token']}"}
+        else:
+            errors.append(f"regions.{name} needs a token")
+            continue
+        api_url = raw.get('api_url', DEFAULT_API_URL.format(region=raw.get('region', name)))
+        if not isinstance(api_url, str):
+            errors.append(f"regions.{name}.api_url must be a URL")
+            continue
+        api_url = api_url.rstrip('/')
+
+        concurrency = raw.get('concurrency', DEFAULT_CONCURRENCY)
+        if isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+            errors.append(f"regions.{name}.concurrency must be a positive integer")
+            continue
+        rate_limit = raw.get('rate_limit')
+        if rate_limit is not None and (isinstance(rate_limit, bool) or not isinstance(rate_limit, (int, float))
+                                       or rate_limit <= 0):
+            errors.append(f"regions.{name}.rate_limit must be a positive number of requests per second")
+            continue
+        timeout = raw.get('timeout', DEFAULT_TIMEOUT)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            errors.append(f"regions.{name}.timeout must be a positive number of seconds")
+            continue
+        breaker = _compile_breaker(raw.get('breaker', {}), f"regions.{name}.breaker", errors)
+        if breaker is None:
+            continue
+        regions[name] = Region(name, api_url, MappingProxyType(region_headers), concurrency, rate_limit,
+                               timeout, breaker)
+
+    # Circuit breakers are shared by every region entry of a host, so they must agree on the settings
+    host_breakers = {}
+    for name, region in regions.items():
+        host = urlsplit(region.api_url).netloc
+        other = host_breakers.setdefault(host, (name, region.breaker))
+        if other[1] != region.breaker:
+            errors.append(f"regions.{name}.breaker differs from regions.{other[0]}.breaker, "
+                          f"but both regions use {host}")
+    return regions
+
+
+def _compile_breaker(raw, field, errors):
+    if not isinstance(raw, dict):
+        errors.append(f"{field} must be a table")
+        return None
+    unknown = set(raw) - set(BreakerSettings.__dataclass_fields__)
+    if unknown:
+        errors.append(f"{field} has unknown settings: {', '.join(sorted(unknown))}")
+        return None
+    if any(isinstance(value, bool) or not isinstance(value, (int, float)) for value in raw.values()):
+        errors.append(f"{field} settings must be numbers")
+        return None
+    settings = BreakerSettings(**raw)
+    if not 0 < settings.failure_rate <= 1:
+        errors.append(f"{field}.failure_rate must be between 0 and 1")
+    elif not 1 <= settings.min_calls <= settings.window:
+        errors.append(f"{field}.min_calls must be between 1 and the window size")
+    elif settings.reset_seconds <= 0:
+        errors.append(f"{field}.reset_seconds must be positive")
+    else:
+        return settings
+    return None
+
+
+def _table(value, name, errors):
+    if not isinstance(value, dict):
+        errors.append(f"{name} must be a table")
+        return {}
+    return value
+
+
+def _tables(value):
+    # Sections that may be given once as a table or several times as an array of tables
+    if isinstance(value, dict):
+        return [value]
+    return value if isinstance(value, list) else [None]
+
+
+def _check_region(name, regions, field, errors):
+    if name is not None and not isinstance(name, str):
+        errors.append(f"{field} must be a region name")
+        return False
+    if name is not None and regions and name not in regions:
+        errors.append(f"{field} refers to unknown region '{name}'")
+    return True
+
+
+def compile_config(raw, source=None):
+    """
+    Validate raw configuration data and compile it into an immutable Config.
+
+    Parameters:
+    -----------
+    raw : dict
+        Configuration data, as read from a file or built from a script's constants.
+    source : str, optional
+        Where the data came from, used in error messages.
+
+    Returns:
+    --------
+    Config
+        The compiled configuration.
+
+    Raises:
+    -------
+    ConfigError
+        Listing every problem found in the configuration.
+    """
+    errors = []
+    if not isinstance(raw, dict):
+        raise ConfigError(f"Configuration {source or ''} must be a mapping at the top level")
+
+    raw_smtp = _table(raw.get('smtp', {}), 'smtp', errors)
+    smtp = SmtpSettings(
+        server=raw_smtp.get('server', 'smtp.gmail.com'),
+        port=raw_smtp.get('port', 587),
+        user=raw_smtp.get('user', ''),
+        password=raw_smtp.get('password', ''),
+    )
+    if isinstance(smtp.port, bool) or not isinstance(smtp.port, int):
+        errors.append("smtp.port must be an integer")
+
+    regions = _compile_regions(raw.get('regions'), errors)
+    default_region = raw.get('default_region') or (next(iter(regions)) if regions else None)
+    _check_region(default_region, regions, 'default_region', errors)
+
+    recipients = {}
+    raw_recipients = raw.get('recipients', {})
+    if not isinstance(raw_recipients, dict):
+        errors.append("recipients must map each primary address to its CC list")
+    else:
+        for to_email, cc_list in raw_recipients.items():
+            recipients[to_email] = _string_list(cc_list, f"recipients.{to_email}", errors)
+
+    tzinfos = {}
+    for abbreviation, offset in _table(raw.get('timezones', {}), 'timezones', errors).items():
+        if isinstance(offset, bool) or not isinstance(offset, (int, float)) or abs(offset) > 14:
+            errors.append(f"timezones.{abbreviation} must be a UTC offset in hours")
+            continue
+        tzinfos[abbreviation] = int(offset * 3600)
+
+    raw_thresholds = _table(raw.get('thresholds', {}), 'thresholds', errors)
+    warning_lag = _minutes(raw_thresholds.get('warning_minutes', DEFAULT_WARNING_MINUTES),
+                           'thresholds.warning_minutes', errors)
+    critical_lag = _minutes(raw_thresholds.get('critical_minutes', DEFAULT_CRITICAL_MINUTES),
+                            'thresholds.critical_minutes', errors)
+    warning_given = 'warning_minutes' in raw_thresholds
+    if not warning_given and warning_lag and critical_lag:
+        # Scripts with a single threshold only set the critical one; the default warning never exceeds it
+        warning_lag = min(warning_lag, critical_lag)
+
+    pipelines = {}
+    raw_pipelines = raw.get('pipelines', [])
+    if not isinstance(raw_pipelines, list):
+        errors.append("pipelines must be a list of pipeline IDs or tables")
+        raw_pipelines = []
+    for index, raw_pipeline in enumerate(raw_pipelines):
+        field = f"pipelines[{index}]"
+        if isinstance(raw_pipeline, int) and not isinstance(raw_pipeline, bool):
+            raw_pipeline = {'id': raw_pipeline}
+        pipeline_id = raw_pipeline.get('id') if isinstance(raw_pipeline, dict) else None
+        if isinstance(pipeline_id, bool) or not isinstance(pipeline_id, int):
+            errors.append(f"{field} needs an integer id")
+            continue
+        region = raw_pipeline.get('region', default_region)
+        if not _check_region(region, regions, f"{field}.region", errors):
+            continue
+        if (region, pipeline_id) in pipelines:
+            errors.append(f"{field} repeats pipeline {pipeline_id} of region '{region}'")
+            continue
+        pipeline_warning = warning_lag
+        pipeline_critical = critical_lag
+        if 'warning_minutes' in raw_pipeline:
+            pipeline_warning = _minutes(raw_pipeline['warning_minutes'], f"{field}.warning_minutes", errors)
+        if 'critical_minutes' in raw_pipeline:
+            pipeline_critical = _minutes(raw_pipeline['critical_minutes'], f"{field}.critical_minutes", errors)
+        if pipeline_warning and pipeline_critical:
+            if not warning_given and 'warning_minutes' not in raw_pipeline:
+                pipeline_warning = min(pipeline_warning, pipeline_critical)
+            elif pipeline_warning >= pipeline_critical:
+                errors.append(f"{field} warning threshold must be lower than its critical threshold")
+        owners = _string_list(raw_pipeline.get('owners', []), f"{field}.owners", errors)
+        for owner in owners:
+            if owner not in recipients:
+                errors.append(f"{field}.owners refers to unknown recipient '{owner}'")
+        pipelines[region, pipeline_id] = PipelineSettings(pipeline_id, region, pipeline_warning, pipeline_critical,
+                                                          owners)
+
+    restarts = []
+    for index, raw_restart in enumerate(_tables(raw.get('restart', []))):
+        field = f"restart[{index}]"
+        if not isinstance(raw_restart, dict):
+            errors.append(f"{field} must be a table")
+            continue
+        objects = _string_list(raw_restart.get('objects', []), f"{field}.objects", errors)
+        pipeline_id = raw_restart.get('pipeline_id')
+        if isinstance(pipeline_id, bool) or not isinstance(pipeline_id, int):
+            errors.append(f"{field}.pipeline_id must be an integer")
+            continue
+        region = raw_restart.get('region', default_region)
+        _check_region(region, regions, f"{field}.region", errors)
+        restarts.append(RestartTarget(region, pipeline_id, objects))
+
+    model_targets = []
+    for index, raw_models in enumerate(_tables(raw.get('models', []))):
+        field = f"models[{index}]"
+        if not isinstance(raw_models, dict):
+            errors.append(f"{field} must be a table")
+            continue
+        region = raw_models.get('region', default_region)
+        _check_region(region, regions, f"{field}.region", errors)
+        model_targets.append(ModelTarget(region, _id_list(raw_models.get('ids', []), f"{field}.ids", errors)))
+
+    # Routing index: (region, pipeline ID) -> primary recipients, with None as the route of unowned pipelines
+    everyone = tuple(recipients)
+    routes = {key: settings.owners or everyone for key, settings in pipelines.items()}
+    routes[None] = everyone
+
+    if errors:
+        location = f" in {source}" if source else ""
+        raise ConfigError(f"Invalid configuration{location}:\n  - " + "\n  - ".join(errors))
+
+    return Config(
+        smtp=smtp,
+        regions=MappingProxyType(regions),
+        recipients=MappingProxyType(recipients),
+        tzinfos=MappingProxyType(tzinfos),
+        pipelines=MappingProxyType(pipelines),
+        default_region=default_region,
+        warning_lag=warning_lag,
+        critical_lag=critical_lag,
+        slack_webhook_url=raw.get('slack_webhook_url'),
+        restarts=tuple(restarts),
+        model_targets=tuple(model_targets),
+        routes=MappingProxyType(routes),
+        source=source,
+    )
+
+
+class ConfigReloader:
+    """
+    Keeps the compiled configuration of a long-running script up to date with its file.
+
+    The file is only re-read when its modification time or size changes, and at most once
+    per check interval. A file that fails validation is reported and the previous
+    configuration stays in use, so a bad edit never stops a running monitor.
+
+    Parameters:
+    -----------
+    path : str
+        Path of the configuration file.
+    check_interval : float
+        Minimum number of seconds between two checks of the file.
+    """
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.stamp = self._stamp()
+        self.config = load_config(path)
+        self.checked_at = time.monotonic()
+
+    def _stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def current(self):
+        """
+        Return the current configuration, reloading the file first if it has changed.
+
+        Returns:
+        --------
+        Config
+            The most recent valid configuration.
+        """
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return self.config
+        self.checked_at = now
+
+        try:
+            stamp = self._stamp()
+            if stamp != self.stamp:
+                self.stamp = stamp
+                self.config = load_config(self.path)
+                print(f"Reloaded configuration from {self.path}")
+        except (ConfigError, OSError) as e:
+            print(f"Keeping previous configuration: {e}")
+        return self.config
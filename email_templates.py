@@ -0,0 +1,187 @@
+"""
+Author: Hevo
+File  : email_templates.py
+
+Purpose:
+--------
+This module renders the HTML lag digest sent by the email alert scripts: a table of pipelines
+sorted by severity, each with a sparkline of its recent lag history. Templates are compiled once
+when the module is imported, and sparkline images are cached so a pipeline reported to several
+recipients is only drawn once. Sparklines are small PNGs written with the standard library only,
+attached to the email as inline (Content-ID) images.
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import struct
+import zlib
+from functools import lru_cache
+from html import escape
+from string import Template
+
+from notification_routing import CRITICAL, EARLY_WARNING, ERROR, OK, SEVERITY_NAMES, WARNING
+
+SPARKLINE_WIDTH = 120
+SPARKLINE_HEIGHT = 24
+
+SEVERITY_COLORS = {
+    OK: (92, 184, 92),
+    EARLY_WARNING: (240, 173, 78),
+    WARNING: (240, 173, 78),
+    CRITICAL: (217, 83, 79),
+    ERROR: (119, 119, 119),
+}
+
+DIGEST_TEMPLATE = Template("""\
+<html>
+  <body style="font-family: Arial, sans-serif; font-size: 14px; color: #333;">
+    <p>$intro</p>
+    <table cellpadding="6" cellspacing="0" style="border-collapse: collapse; border: 1px solid #ddd;">
+      <tr style="background: #f5f5f5; text-align: left;">
+        <th>Pipeline</th><th>Status</th><th>Lag</th><th>Recent lag</th><th>Details</th>
+      </tr>
+$rows
+    </table>
+  </body>
+</html>
+""")
+
+ROW_TEMPLATE = Template("""\
+      <tr style="border-top: 1px solid #ddd;">
+        <td>$pipeline_id</td>
+        <td style="color: $color; font-weight: bold;">$status</td>
+        <td>$lag</td>
+        <td>$sparkline</td>
+        <td style="white-space: pre-line; font-size: 12px;">$details</td>
+      </tr>""")
+
+SPARKLINE_TEMPLATE = Template(
+    '<img src="cid:$cid" width="$width" height="$height" alt="Lag history of pipeline $pipeline_id">')
+
+
+def _png_chunk(chunk_type, data):
+    chunk = chunk_type + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+
+@lru_cache(maxsize=4096)
+def sparkline_png(points, color=(217, 83, 79), width=SPARKLINE_WIDTH, height=SPARKLINE_HEIGHT):
+    """
+    Draw a sparkline as a PNG image. Results are cached, so identical histories are drawn once.
+
+    Parameters:
+    -----------
+    points : tuple of tuple
+        (time, value) pairs, oldest first. At least two are needed.
+    color : tuple of int
+        RGB color of the line.
+    width, height : int
+        Image size in pixels.
+
+    Returns:
+    --------
+    bytes
+        The PNG image.
+    """
+    times = [point[0] for point in points]
+    values = [point[1] for point in points]
+    time_span = (times[-1] - times[0]) or 1.0
+    low, high = min(values), max(values)
+    value_span = (high - low) or 1.0
+
+    coordinates = [
+        (round((t - times[0]) / time_span * (width - 1)),
+         round((height - 2) - (v - low) / value_span * (height - 3)) if high != low else height // 2)
+        for t, v in points
+    ]
+
+    # RGBA pixels on a transparent background
+    pixels = [bytearray(width * 4) for _ in range(height)]
+
+    def plot(x, y):
+        if 0 <= x < width and 0 <= y < height:
+            pixels[y][x * 4:x * 4 + 4] = bytes((*color, 255))
+
+    for (x0, y0), (x1, y1) in zip(coordinates, coordinates[1:]):
+        # Bresenham's line algorithm
+        dx, dy = abs(x1 - x0), -abs(y1 - y0)
+        step_x, step_y = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+        error = dx + dy
+        while True:
+            plot(x0, y0)
+            if x0 == x1 and y0 == y1:
+                break
+            doubled = 2 * error
+            if doubled >= dy:
+                error += dy
+                x0 += step_x
+            if doubled <= dx:
+                error += dx
+                y0 += step_y
+
+    raw = b''.join(b'\x00' + bytes(row) for row in pixels)
+    return (b'\x89PNG\r\n\x1a\n'
+            + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + _png_chunk(b'IDAT', zlib.compress(raw, 9))
+            + _png_chunk(b'IEND', b''))
+
+
+def _format_lag(lag):
+    if lag is None:
+        return 'n/a'
+    hours = lag.total_seconds() / 3600
+    return f"{hours:.2f} hours" if hours >= 1 else f"{lag.total_seconds() / 60:.2f} minutes"
+
+
+def _pipeline_label(check):
+    if check.pipeline_id is None:
+        return 'All'
+    return f"{check.pipeline_id} ({escape(check.region)})" if check.region else check.pipeline_id
+
+
+def render_html_digest(checks, forecaster, intro):
+    """
+    Render the HTML digest for a recipient's lag checks.
+
+    Parameters:
+    -----------
+    checks : list of LagCheck
+        The lag checks to include.
+    forecaster : LagForecaster
+        Holds the recorded lag history used for the sparklines.
+    intro : str
+        The opening line of the digest.
+
+    Returns:
+    --------
+    tuple
+        The HTML document and a dict of inline images (Content-ID -> PNG bytes).
+    """
+    ordered = sorted(checks, key=lambda check: (check.severity, check.lag.total_seconds() if check.lag else 0),
+                     reverse=True)
+    rows = []
+    images = {}
+    for check in ordered:
+        sparkline = ''
+        history = tuple(forecaster.history((check.region, check.pipeline_id)))
+        if len(history) >= 2:
+            cid = f"lag-{check.region}-{check.pipeline_id}@magic-scripts"
+            images[cid] = sparkline_png(history, SEVERITY_COLORS[check.severity])
+            sparkline = SPARKLINE_TEMPLATE.substitute(cid=cid, width=SPARKLINE_WIDTH, height=SPARKLINE_HEIGHT,
+                                                      pipeline_id=check.pipeline_id)
+        rows.append(ROW_TEMPLATE.substitute(
+            pipeline_id=_pipeline_label(check),
+            color='rgb(%d, %d, %d)' % SEVERITY_COLORS[check.severity],
+            status=SEVERITY_NAMES[check.severity],
+            lag=_format_lag(check.lag),
+            sparkline=sparkline,
+            details=escape(check.text.strip()),
+        ))
+    return DIGEST_TEMPLATE.substitute(intro=escape(intro), rows='\n'.join(rows)), images
@@ -1,4 +1,3 @@
-empty_column_generator.py
 """
 Author: Hevo
 File  : empty_column_generator.py
@@ -7,6 +6,23 @@ Purpose:
 --------
 It showcases a simple transformation process where the empty column data is replicated into the destination table in BigQuery.
 
+Run once, it adds the columns of each MySQL table in TABLES that are missing from its BigQuery table.
+With --watch it keeps running and syncs a table within seconds of its columns changing, so new fields
+do not land as NULL until the next run. Changes are detected either by polling a fingerprint of the
+watched tables' columns (one small information_schema query per interval), or with --binlog by
+tailing the MySQL binlog for ALTER TABLE statements, which needs the optional python-mysql-replication
+package, binary logging enabled and a user with the REPLICATION SLAVE and REPLICATION CLIENT privileges.
+Only the tables that changed are queued and synced.
+
+    python empty_column_generator.py                            # sync every table once
+    python empty_column_generator.py --watch --interval 2       # poll for column changes
+    python empty_column_generator.py --watch --binlog           # react to ALTER TABLE in the binlog
+    python empty_column_generator.py --watch --stub-bigquery    # try it against a local MySQL only
+
+A local MySQL with binary logging enabled, for trying either watch mode:
+
+    docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=hevo -e MYSQL_DATABASE=hevo mysql:8 --server-id=1 --log-bin
+
 Usage Documentation:
 --------------------
 https://api-docs.hevodata.com/reference/introduction
@@ -17,9 +33,58 @@ This script has no license. It is provided "as-is" without any warranty. Feel fr
 and modify it for any purpose.
 """
 
+import argparse
+import queue
+import re
+import threading
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+
 import mysql.connector
-from google.cloud import bigquery
-from google.oauth2 import service_account
+from instrumentation import span, timed
+
+try:
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
+    SchemaField = bigquery.SchemaField
+except ImportError:
+    # Only --stub-bigquery works without google-cloud-bigquery
+    bigquery = None
+    SchemaField = namedtuple('SchemaField', ['name', 'field_type'])
+
+try:
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.event import QueryEvent
+except ImportError:
+    # Only needed for --binlog
+    BinLogStreamReader = None
+
+# MySQL connection settings
+MYSQL_CONFIG = {
+    'user': '<user>',
+    'password': '<db_password>',
+    'host': '<db_host>',
+    'port': 3306,
+    'database': '<db_name>',
+}
+
+# BigQuery project and service account key
+BIGQUERY_PROJECT = '<hevo-test-project-id>'     # Add the project id
+CREDENTIALS_FILE = r'< JSON FILE PATH >'        # Add the path of your JSON file
+
+# MySQL source table -> (BigQuery dataset, BigQuery destination table)
+TABLES = {
+    'mysql_table_name': ('dataset_name', 'bigquery_table_name'),
+}
+
+# Watch mode
+POLL_INTERVAL = 5               # Seconds between two checks of the column fingerprints
+BINLOG_SERVER_ID = 4179         # Replica server ID used to read the binlog, unique among the server's replicas
+
+ALTER_TABLE_PATTERN = re.compile(
+    r'^\s*(?:/\*.*?\*/\s*)*ALTER\s+(?:ONLINE\s+|IGNORE\s+)*TABLE\s+(?:`?(\w+)`?\s*\.\s*)?`?(\w+)`?',
+    re.IGNORECASE | re.DOTALL)
 
 def get_mysql_connection():
     """
@@ -30,12 +95,10 @@ def get_mysql_connection():
     mysql.connector.connection.MySQLConnection
         MySQL connection object.
     """
-    return mysql.connector.connect(
-        user='<user>',
-        password='<db_password>',
-        host='<db_host>',
-        database='<db_name>'
-    )
+    connection = mysql.connector.connect(**MYSQL_CONFIG)
+    # Every information_schema query must see the latest DDL, not a transaction snapshot
+    connection.autocommit = True
+    return connection
 
 def get_bigquery_client():
     """
@@ -46,11 +109,29 @@ def get_bigquery_client():
     google.cloud.bigquery.Client
         BigQuery client object.
     """
-    credentials = service_account.Credentials.from_service_account_file(
-        r'< JSON FILE PATH >'  # Add the path of your JSON file
-    )
-    return bigquery.Client(project='<hevo-test-project-id>', credentials=credentials) #Add the project id
+    if bigquery is None:
+        raise RuntimeError("google-cloud-bigquery is not installed: pip install google-cloud-bigquery, "
+                           "or use --stub-bigquery")
+    credentials = service_account.Credentials.from_service_account_file(CREDENTIALS_FILE)
+    return bigquery.Client(project=BIGQUERY_PROJECT, credentials=credentials)
+
+class StubBigQueryClient:
+    """
+    In-memory stand-in for the BigQuery client, used with --stub-bigquery to try the sync against
+    a local MySQL database without a BigQuery project. Tables start out empty.
+    """
+
+    def __init__(self):
+        self.tables = {}
+
+    def get_table(self, table_id):
+        return self.tables.setdefault(table_id, SimpleNamespace(table_id=table_id, schema=[]))
 
+    def update_table(self, table, fields):
+        self.tables[table.table_id] = table
+        return table
+
+@timed()
 def get_columns(cursor, table_name):
     """
     Retrieve column names from a MySQL table.
@@ -67,9 +148,38 @@ def get_columns(cursor, table_name):
     list of str
         List of column names in uppercase.
     """
-    cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table_name}'")
+    cursor.execute("SELECT column_name FROM information_schema.columns "
+                   "WHERE table_schema = DATABASE() AND table_name = %s", (table_name,))
     return [row[0].upper() for row in cursor.fetchall()]
 
+@timed()
+def get_column_fingerprints(cursor, table_names):
+    """
+    Retrieve a fingerprint of the columns of several MySQL tables in a single query, so that
+    column changes can be detected without listing every column of every table.
+
+    Parameters:
+    -----------
+    cursor : mysql.connector.cursor.MySQLCursor
+        MySQL cursor object.
+    table_names : list of str
+        Names of the MySQL tables.
+
+    Returns:
+    --------
+    dict
+        Table name -> fingerprint of its column names and types. Missing tables are left out.
+    """
+    if not table_names:
+        return {}  # IN () is not valid SQL
+    placeholders = ', '.join(['%s'] * len(table_names))
+    cursor.execute("SELECT table_name, COUNT(*), SUM(CRC32(CONCAT_WS(':', ordinal_position, column_name, column_type))) "
+                   "FROM information_schema.columns "
+                   f"WHERE table_schema = DATABASE() AND table_name IN ({placeholders}) "
+                   "GROUP BY table_name", tuple(table_names))
+    return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+@timed()
 def get_columns_bigquery(client, dataset_name, table_name):
     """
     Retrieve column names from a BigQuery table.
@@ -88,9 +198,7 @@ def get_columns_bigquery(client, dataset_name, table_name):
     list of str
         List of column names in uppercase.
     """
-    dataset_ref = client.dataset(dataset_name)
-    table_ref = dataset_ref.table(table_name)
-    table = client.get_table(table_ref)
+    table = client.get_table(f"{dataset_name}.{table_name}")
     return [schema_field.name.upper() for schema_field in table.schema]
 
 def add_columns_to_bigquery(client, dataset_name, table_name, columns):
@@ -114,47 +222,257 @@ def add_columns_to_bigquery(client, dataset_name, table_name, columns):
 
     for column in columns:
         if column not in existing_columns:
-            new_schema.append(bigquery.SchemaField(column, "STRING"))
+            new_schema.append(SchemaField(column, "STRING"))
     table.schema = new_schema
-    client.update_table(table, ["schema"])
+    with span('update_table', table=f"{dataset_name}.{table_name}"):
+        client.update_table(table, ["schema"])
     print(f"Updated schema of BigQuery table {table_name} with new columns: {columns}")
 
-def main():
-    """
-    Main function to compare columns between a MySQL and a BigQuery table,
-    and add missing columns to the BigQuery table.
+def sync_table(mysql_cursor, bq_client, mysql_table_name, dry_run=False):
     """
-    # Connect to MySQL
-    mysql_conn = get_mysql_connection()
-    mysql_cursor = mysql_conn.cursor()
+    Add the columns of a MySQL table that are missing from its BigQuery table.
 
-    # Connect to BigQuery
-    bq_client = get_bigquery_client()
+    Parameters:
+    -----------
+    mysql_cursor : mysql.connector.cursor.MySQLCursor
+        MySQL cursor object.
+    bq_client : google.cloud.bigquery.Client
+        BigQuery client object.
+    mysql_table_name : str
+        Name of the MySQL table, a key of TABLES.
+    dry_run : bool
+        Only report the missing columns.
 
-    # Table and dataset names
-    mysql_table_name = 'mysql_table_name' # Enter Source table name
-    bq_dataset_name = 'dataset_name' #Enter dataset name
-    bq_table_name = 'bigquery_table_name’' # Enter Destination table name
+    Returns:
+    --------
+    list of str
+        The missing columns.
+    """
+    bq_dataset_name, bq_table_name = TABLES[mysql_table_name]
 
     # Get columns from MySQL
     mysql_columns = get_columns(mysql_cursor, mysql_table_name)
-    print(f"Retrieved MySQL columns: {mysql_columns}")
+    print(f"Retrieved MySQL columns of {mysql_table_name}: {mysql_columns}")
 
     # Get columns from BigQuery
     bq_columns = get_columns_bigquery(bq_client, bq_dataset_name, bq_table_name)
-    print(f"Retrieved BigQuery columns: {bq_columns}")
+    print(f"Retrieved BigQuery columns of {bq_dataset_name}.{bq_table_name}: {bq_columns}")
 
-    # Find columns present in MySQL but not in BigQuery
-    missing_columns = list(set(mysql_columns) - set(bq_columns))
+    # Find columns present in MySQL but not in BigQuery, in MySQL order
+    existing_columns = set(bq_columns)
+    missing_columns = [column for column in mysql_columns if column not in existing_columns]
     print(f"Missing columns in BigQuery: {missing_columns}")
 
-    if missing_columns:
+    if missing_columns and not dry_run:
         # Add missing columns to BigQuery
         add_columns_to_bigquery(bq_client, bq_dataset_name, bq_table_name, missing_columns)
+    return missing_columns
+
+class TableSyncQueue:
+    """
+    Syncs the tables queued by the watcher one at a time, from a background thread with its own
+    MySQL connection. A table already waiting in the queue is not queued twice.
+
+    Parameters:
+    -----------
+    bq_client : google.cloud.bigquery.Client
+        BigQuery client object.
+    dry_run : bool
+        Only report the missing columns.
+    """
+
+    def __init__(self, bq_client, dry_run=False):
+        self.bq_client = bq_client
+        self.dry_run = dry_run
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='column-sync', daemon=True)
+
+    def put(self, mysql_table_name):
+        """
+        Queue a table for syncing.
+        """
+        with self.lock:
+            if mysql_table_name in self.pending:
+                return
+            self.pending.add(mysql_table_name)
+        self.queue.put(mysql_table_name)
+
+    def run(self):
+        mysql_conn = None
+        while True:
+            mysql_table_name = self.queue.get()
+            if mysql_table_name is None:
+                break
+            # Taken off the pending set first, so a change made during the sync queues the table again
+            with self.lock:
+                self.pending.discard(mysql_table_name)
+            try:
+                if mysql_conn is None or not mysql_conn.is_connected():
+                    mysql_conn = get_mysql_connection()
+                mysql_cursor = mysql_conn.cursor()
+                try:
+                    sync_table(mysql_cursor, self.bq_client, mysql_table_name, self.dry_run)
+                finally:
+                    mysql_cursor.close()
+            except Exception as e:
+                print(f"Failed to sync table {mysql_table_name}: {e}")
+        if mysql_conn is not None:
+            mysql_conn.close()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Sync the tables still queued, then stop the background thread.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+def poll_changes(sync_queue, interval=POLL_INTERVAL):
+    """
+    Queue every table whose column fingerprint changes, checking every `interval` seconds.
+    A lost MySQL connection is re-established on the next check.
+
+    Parameters:
+    -----------
+    sync_queue : TableSyncQueue
+        Where to queue the changed tables.
+    interval : float
+        Seconds between two checks.
+    """
+    mysql_conn = None
+    fingerprints = None
+    try:
+        while True:
+            try:
+                if mysql_conn is None or not mysql_conn.is_connected():
+                    mysql_conn = get_mysql_connection()
+                mysql_cursor = mysql_conn.cursor()
+                try:
+                    latest = get_column_fingerprints(mysql_cursor, list(TABLES))
+                finally:
+                    mysql_cursor.close()
+            except mysql.connector.Error as e:
+                print(f"Failed to check the columns, retrying in {interval} seconds: {e}")
+            else:
+                if fingerprints is not None:
+                    for mysql_table_name in TABLES:
+                        if latest.get(mysql_table_name) != fingerprints.get(mysql_table_name):
+                            print(f"Columns of {mysql_table_name} changed")
+                            sync_queue.put(mysql_table_name)
+                fingerprints = latest
+            time.sleep(interval)
+    finally:
+        if mysql_conn is not None:
+            mysql_conn.close()
+
+def tail_binlog(sync_queue):
+    """
+    Queue every watched table named by an ALTER TABLE statement in the MySQL binlog, as it is written.
+
+    Parameters:
+    -----------
+    sync_queue : TableSyncQueue
+        Where to queue the altered tables.
+    """
+    if BinLogStreamReader is None:
+        raise RuntimeError("--binlog needs the python-mysql-replication package: pip install mysql-replication")
+    connection_settings = {
+        'host': MYSQL_CONFIG['host'],
+        'port': MYSQL_CONFIG.get('port', 3306),
+        'user': MYSQL_CONFIG['user'],
+        'passwd': MYSQL_CONFIG['password'],
+    }
+    stream = BinLogStreamReader(connection_settings=connection_settings, server_id=BINLOG_SERVER_ID,
+                                only_events=[QueryEvent], blocking=True, resume_stream=True)
+    try:
+        for event in stream:
+            match = ALTER_TABLE_PATTERN.match(event.query)
+            if not match:
+                continue
+            schema = event.schema.decode() if isinstance(event.schema, bytes) else event.schema
+            if (match.group(1) or schema) != MYSQL_CONFIG['database']:
+                continue
+            if match.group(2) in TABLES:
+                print(f"Binlog: {event.query.strip()}")
+                sync_queue.put(match.group(2))
+    finally:
+        stream.close()
+
+def watch(bq_client, interval=POLL_INTERVAL, binlog=False, dry_run=False):
+    """
+    Sync every table once, then keep syncing the tables whose columns change, until interrupted.
+
+    Parameters:
+    -----------
+    bq_client : google.cloud.bigquery.Client
+        BigQuery client object.
+    interval : float
+        Seconds between two fingerprint checks, when polling.
+    binlog : bool
+        Tail the binlog for ALTER TABLE statements instead of polling.
+    dry_run : bool
+        Only report the missing columns.
+    """
+    sync_queue = TableSyncQueue(bq_client, dry_run).start()
+    try:
+        # Catch up on the changes made while nothing was watching
+        for mysql_table_name in TABLES:
+            sync_queue.put(mysql_table_name)
+        if binlog:
+            tail_binlog(sync_queue)
+        else:
+            poll_changes(sync_queue, interval)
+    finally:
+        sync_queue.stop()
+
+def main(bq_client=None, dry_run=False):
+    """
+    Main function to compare columns between the MySQL and the BigQuery tables in TABLES,
+    and add missing columns to the BigQuery tables.
+
+    Parameters:
+    -----------
+    bq_client : google.cloud.bigquery.Client, optional
+        BigQuery client object, created from the service account if not given.
+    dry_run : bool
+        Only report the missing columns.
+    """
+    # Connect to MySQL
+    mysql_conn = get_mysql_connection()
+    mysql_cursor = mysql_conn.cursor()
+
+    # Connect to BigQuery
+    bq_client = bq_client or get_bigquery_client()
+
+    for mysql_table_name in TABLES:
+        sync_table(mysql_cursor, bq_client, mysql_table_name, dry_run)
 
     # Close connections
     mysql_cursor.close()
     mysql_conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Add the columns of MySQL tables missing from their BigQuery tables.")
+    arg_parser.add_argument('--watch', action='store_true', help="Keep running and sync tables as soon as their columns change")
+    arg_parser.add_argument('--interval', type=float, default=POLL_INTERVAL,
+                            help="Seconds between two checks of the columns when watching (default: %(default)s)")
+    arg_parser.add_argument('--binlog', action='store_true',
+                            help="When watching, tail the binlog for ALTER TABLE instead of polling (needs mysql-replication)")
+    arg_parser.add_argument('--dry-run', action='store_true', help="Only report the missing columns")
+    arg_parser.add_argument('--stub-bigquery', action='store_true',
+                            help="Use an in-memory BigQuery stand-in whose tables start out empty, for local testing")
+    args = arg_parser.parse_args()
+
+    bq_client = StubBigQueryClient() if args.stub_bigquery else get_bigquery_client()
+    if args.watch:
+        try:
+            watch(bq_client, args.interval, args.binlog, args.dry_run)
+        except KeyboardInterrupt:
+            pass
+    else:
+        main(bq_client, args.dry_run)
\ No newline at end of file
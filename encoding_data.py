@@ -1,4 +1,3 @@
-encoding_data.py
 """
 Author: Hevo
 File  : encoding_data.py
@@ -19,7 +18,12 @@ and modify it for any purpose.
 """
 
 import base64
-from io.hevo.api import Event
+
+try:
+    from io.hevo.api import Event
+except ImportError:
+    # Only available inside Hevo transformations; mask_data() is also used by bulk_mask_data.py
+    Event = None
 
 """
 event: each record streaming through Hevo pipeline is an event
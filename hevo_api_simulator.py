@@ -0,0 +1,357 @@
+"""
+Author: Hevo
+File  : hevo_api_simulator.py
+
+Purpose:
+--------
+This script runs a local stand-in for the parts of the Hevo public API used by the scripts in this
+repository, plus a Slack-style incoming webhook, so that they can be tried out and benchmarked
+without a Hevo account. Responses are generated from the IDs in the request, so any number of
+pipelines, objects and models can be simulated, and the server can be told to add latency, fail a
+share of the requests with a 500 and throttle another share with a 429.
+
+    python hevo_api_simulator.py --port 8080 --latency 50 --error-rate 0.01 --throttle-rate 0.05
+
+Point a region of the configuration file at it:
+
+    [regions.local]
+    api_url = "http://127.0.0.1:8080/api/public/v2.0"
+    token = "anything"
+
+and use http://127.0.0.1:8080/slack/webhook as the Slack webhook URL. GET /_stats returns the
+number of requests served per endpoint and status code; POST /_reset clears it.
+
+Simulated endpoints:
+    GET  /api/public/v2.0/pipelines/{id}/position
+    GET  /api/public/v2.0/pipelines/{id}/objects?limit=&starting_after=
+    POST /api/public/v2.0/pipelines/{id}/objects/{name}/restart
+    GET  /api/public/v2.0/models/{id}
+    POST /api/public/v2.0/models/{id}/run-now
+    POST /slack/webhook
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = '/api/public/v2.0'
+IST = timezone(timedelta(hours=5, minutes=30))
+OBJECT_STATUSES = ('ACTIVE', 'ACTIVE', 'ACTIVE', 'PAUSED', 'FAILED')
+MODEL_STATUSES = ('ACTIVE', 'ACTIVE', 'ACTIVE', 'RUNNING', 'QUEUED')
+
+
+@dataclass
+class SimulatorSettings:
+    """
+    Behaviour of the simulated API.
+
+    Parameters:
+    -----------
+    latency : float
+        Seconds added to every response.
+    jitter : float
+        Up to this many extra seconds, picked at random, added to every response.
+    error_rate : float
+        Share of API and Slack webhook requests answered with a 500.
+    throttle_rate : float
+        Share of API and Slack webhook requests answered with a 429 and a Retry-After header.
+    objects_per_pipeline : int
+        Number of objects listed for every pipeline.
+    lag_minutes : float
+        Lag of the pipelines that are keeping up; their positions are 0 to 2 times this far behind.
+    lagging_share : float
+        Share of pipelines whose lag is above 12 hours.
+    seed : int, optional
+        Seed of the random errors, throttling and jitter, for reproducible runs.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    objects_per_pipeline: int = 20
+    lag_minutes: float = 30.0
+    lagging_share: float = 0.1
+    seed: int = None
+
+
+def _fraction(*parts):
+    # Stable pseudo-random number in [0, 1) for an entity, the same on every request and run
+    return zlib.crc32(':'.join(str(part) for part in parts).encode()) / 2 ** 32
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'HevoApiSimulator'
+    # Headers and body are written separately; without TCP_NODELAY every keep-alive response
+    # would wait for the client's delayed ACK (~40 ms) and the simulator would dominate benchmarks
+    disable_nagle_algorithm = True
+
+    routes = [
+        ('GET', re.compile(r'/pipelines/(\d+)/position'), 'pipelines/{id}/position', 'pipeline_position'),
+        ('GET', re.compile(r'/pipelines/(\d+)/objects'), 'pipelines/{id}/objects', 'list_objects'),
+        ('POST', re.compile(r'/pipelines/(\d+)/objects/([^/]+)/restart'), 'pipelines/{id}/objects/{name}/restart',
+         'restart_object'),
+        ('GET', re.compile(r'/models/(\d+)'), 'models/{id}', 'model_status'),
+        ('POST', re.compile(r'/models/(\d+)/run-now'), 'models/{id}/run-now', 'run_model'),
+    ]
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method):
+        simulator = self.server.simulator
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if url.path == '/_stats' and method == 'GET':
+            return self._send(200, simulator.stats())
+        if url.path == '/_reset' and method == 'POST':
+            simulator.reset()
+            return self._send(200, {'success': True})
+        if url.path == '/slack/webhook' and method == 'POST':
+            simulator.pause()
+            outcome = simulator.outcome()
+            simulator.count('slack/webhook', outcome)
+            if outcome == 429:
+                return self._send(429, 'rate_limited', {'Retry-After': '1'})
+            if outcome == 500:
+                return self._send(500, 'Simulated server error')
+            return self._send(200, 'ok')
+
+        if url.path.startswith(API_PREFIX):
+            path = url.path[len(API_PREFIX):]
+            for route_method, pattern, endpoint, handler in self.routes:
+                match = pattern.fullmatch(path)
+                if match and route_method == method:
+                    simulator.pause()
+                    outcome = simulator.outcome()
+                    if outcome == 429:
+                        simulator.count(endpoint, 429)
+                        return self._send(429, {'error': 'Too many requests'}, {'Retry-After': '1'})
+                    if outcome == 500:
+                        simulator.count(endpoint, 500)
+                        return self._send(500, {'error': 'Simulated server error'})
+                    status, payload = getattr(simulator, handler)(*match.groups(), query=parse_qs(url.query),
+                                                                  body=body)
+                    simulator.count(endpoint, status)
+                    return self._send(status, payload)
+
+        simulator.count('unknown', 404)
+        self._send(404, {'error': f'No simulated endpoint for {method} {url.path}'})
+
+    def _send(self, status, payload, extra_headers=None):
+        data = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain' if isinstance(payload, str) else 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class HevoApiSimulator:
+    """
+    A simulated Hevo API served from a background thread.
+
+    Parameters:
+    -----------
+    settings : SimulatorSettings, optional
+        Latency, error rates and data volume. Defaults to a fast, error-free API.
+    host : str
+        The interface to listen on.
+    port : int
+        The port to listen on, 0 to pick a free one.
+    """
+
+    def __init__(self, settings=None, host='127.0.0.1', port=0):
+        self.settings = settings or SimulatorSettings()
+        self.random = random.Random(self.settings.seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.simulator = self
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        The base URL of the server, e.g. http://127.0.0.1:8080.
+        """
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        """
+        The API URL to configure as a region's api_url.
+        """
+        return self.url + API_PREFIX
+
+    @property
+    def slack_webhook_url(self):
+        """
+        The URL to configure as the Slack webhook.
+        """
+        return self.url + '/slack/webhook'
+
+    def start(self):
+        """
+        Start serving from a background thread.
+
+        Returns:
+        --------
+        HevoApiSimulator
+            The simulator itself.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name='hevo-api-simulator', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving and close the listening socket.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        """
+        Return the number of requests served so far.
+
+        Returns:
+        --------
+        dict
+            The total and a breakdown per endpoint and status code.
+        """
+        with self.lock:
+            endpoints = {endpoint: dict(statuses) for endpoint, statuses in self.counts.items()}
+        return {'requests': sum(sum(statuses.values()) for statuses in endpoints.values()), 'endpoints': endpoints}
+
+    def reset(self):
+        """
+        Clear the request counts.
+        """
+        with self.lock:
+            self.counts.clear()
+
+    def count(self, endpoint, status):
+        with self.lock:
+            statuses = self.counts.setdefault(endpoint, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def pause(self):
+        # Simulated network and server latency
+        delay = self.settings.latency
+        if self.settings.jitter:
+            with self.lock:
+                delay += self.random.uniform(0, self.settings.jitter)
+        if delay:
+            time.sleep(delay)
+
+    def outcome(self):
+        # Whether to answer normally (200), throttle (429) or fail (500)
+        if not (self.settings.error_rate or self.settings.throttle_rate):
+            return 200
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.settings.throttle_rate:
+            return 429
+        if draw < self.settings.throttle_rate + self.settings.error_rate:
+            return 500
+        return 200
+
+    def pipeline_position(self, pipeline_id, query, body):
+        if _fraction('lagging', pipeline_id) < self.settings.lagging_share:
+            lag = timedelta(hours=12, minutes=30 + 90 * _fraction('lag', pipeline_id))
+        else:
+            lag = timedelta(minutes=self.settings.lag_minutes * 2 * _fraction('lag', pipeline_id))
+        position = datetime.now(IST) - lag
+        return 200, {'data': {'display_position': f"{position:%Y-%m-%d %H:%M:%S} IST, Seq No {pipeline_id}"}}
+
+    def list_objects(self, pipeline_id, query, body):
+        limit = max(1, min(int(query.get('limit', ['100'])[0]), 1000))
+        start = int(query.get('starting_after', ['-1'])[0]) + 1
+        end = min(start + limit, self.settings.objects_per_pipeline)
+        data = [
+            {'name': f"schema_{pipeline_id}.table_{index}",
+             'status': OBJECT_STATUSES[int(_fraction('object', pipeline_id, index) * len(OBJECT_STATUSES))]}
+            for index in range(start, end)
+        ]
+        pagination = {'starting_after': str(end - 1)} if end < self.settings.objects_per_pipeline else {}
+        return 200, {'data': data, 'pagination': pagination}
+
+    def restart_object(self, pipeline_id, object_name, query, body):
+        return 200, {'success': True, 'data': {'pipeline_id': int(pipeline_id), 'name': object_name}}
+
+    def model_status(self, model_id, query, body):
+        status = MODEL_STATUSES[int(_fraction('model', model_id) * len(MODEL_STATUSES))]
+        return 200, {'data': {'id': int(model_id), 'status': status}}
+
+    def run_model(self, model_id, query, body):
+        return 200, {'success': True, 'data': {'id': int(model_id), 'status': 'QUEUED'}}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve a simulated Hevo API for local testing and benchmarks.")
+    arg_parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on (default: %(default)s)")
+    arg_parser.add_argument('--port', type=int, default=8080, help="Port to listen on (default: %(default)s)")
+    arg_parser.add_argument('--latency', type=float, default=0, help="Milliseconds added to every response")
+    arg_parser.add_argument('--jitter', type=float, default=0, help="Up to this many random milliseconds added to every response")
+    arg_parser.add_argument('--error-rate', type=float, default=0,
+                            help="Share of API and webhook requests answered with a 500, e.g. 0.01")
+    arg_parser.add_argument('--throttle-rate', type=float, default=0,
+                            help="Share of API and webhook requests answered with a 429, e.g. 0.05")
+    arg_parser.add_argument('--objects', type=int, default=20, help="Objects listed per pipeline (default: %(default)s)")
+    arg_parser.add_argument('--lagging-share', type=float, default=0.1,
+                            help="Share of pipelines lagging more than 12 hours (default: %(default)s)")
+    arg_parser.add_argument('--seed', type=int, help="Random seed, for reproducible errors and jitter")
+    args = arg_parser.parse_args()
+
+    simulator = HevoApiSimulator(SimulatorSettings(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        objects_per_pipeline=args.objects,
+        lagging_share=args.lagging_share,
+        seed=args.seed,
+    ), args.host, args.port)
+    print(f"Simulated Hevo API at {simulator.api_url}, Slack webhook at {simulator.slack_webhook_url}")
+    try:
+        simulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.server.server_close()
@@ -0,0 +1,351 @@
+"""
+Author: Hevo
+File  : hevo_client.py
+
+Purpose:
+--------
+This module provides the Hevo API client shared by the scripts in this repository. Each
+(region, credential) target configured in the 'regions' section gets its own client, with its
+own connection pool and rate limit, and sweep() runs a piece of work for many pipelines, objects
+or models across all targets in parallel while returning the results in their original order.
+
+Every request goes through a circuit breaker kept per host and endpoint. Once the share of failed
+calls (network errors, timeouts and 5xx responses) crosses the configured failure rate, the
+circuit opens and further calls fail immediately with CircuitOpenError instead of waiting for a
+timeout. After the reset period a single half-open probe is let through; its outcome closes the
+circuit again or keeps it open.
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RateLimiter:
+    """
+    Spaces out requests so that no more than `rate` are started per second.
+
+    Parameters:
+    -----------
+    rate : float
+        Maximum number of requests per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until the caller may send its request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while the circuit of its endpoint is open.
+    """
+
+    def __init__(self, breaker):
+        super().__init__(f"circuit open for {breaker.name}, request skipped")
+        self.breaker = breaker
+
+
+class CircuitBreaker:
+    """
+    Tracks the recent outcomes of one endpoint and fails fast while it is unhealthy.
+
+    Parameters:
+    -----------
+    name : str
+        The host and endpoint, used in messages.
+    settings : BreakerSettings
+        Failure rate, window, minimum number of calls and reset period.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=settings.window)
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.skipped = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Reserve the right to send a request.
+
+        Raises:
+        -------
+        CircuitOpenError
+            If the circuit is open, or half-open with its probe already in flight.
+        """
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.settings.reset_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return
+            if self.state != self.CLOSED:
+                self.skipped += 1
+                raise CircuitOpenError(self)
+
+    def record(self, success, error=None):
+        """
+        Record the outcome of a request allowed by allow().
+
+        Parameters:
+        -----------
+        success : bool
+            Whether the request succeeded.
+        error : str, optional
+            Description of the failure, kept for the report.
+        """
+        with self.lock:
+            if not success:
+                self.last_error = error
+            if self.state == self.HALF_OPEN:
+                self.probe_in_flight = False
+                if success:
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                else:
+                    self._trip()
+                return
+
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.settings.min_calls and \
+                    failures / len(self.outcomes) >= self.settings.failure_rate:
+                self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(host, endpoint, settings):
+    """
+    Return the circuit breaker of a host and endpoint, shared by every client of that host.
+    compile_config() ensures the regions of a host agree on the settings, so the breaker is only
+    replaced when a reloaded configuration changes them.
+
+    Parameters:
+    -----------
+    host : str
+        The API host.
+    endpoint : str
+        The endpoint, e.g. 'pipelines/{id}/position'.
+    settings : BreakerSettings
+        The breaker settings of the target.
+
+    Returns:
+    --------
+    CircuitBreaker
+        The breaker of the endpoint.
+    """
+    key = (host, endpoint)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None or breaker.settings != settings:
+            breaker = _breakers[key] = CircuitBreaker(f"{host} {endpoint}", settings)
+        return breaker
+
+
+def breaker_report():
+    """
+    Summarise the circuits that are open or skipped requests since the last report.
+
+    Returns:
+    --------
+    list of str
+        One line per affected endpoint, empty when every circuit is healthy.
+    """
+    lines = []
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    for breaker in breakers:
+        with breaker.lock:
+            if breaker.state == breaker.CLOSED and not breaker.skipped:
+                continue
+            line = f"Circuit breaker {breaker.state} for {breaker.name}: {breaker.skipped} requests skipped"
+            if breaker.last_error:
+                line += f", last error: {breaker.last_error}"
+            lines.append(line)
+            breaker.skipped = 0
+    return lines
+
+
+class HevoClient:
+    """
+    Client for one Hevo (region, credential) target.
+
+    Parameters:
+    -----------
+    region : Region
+        The target's API URL, headers, concurrency and rate limit, from the configuration.
+    """
+
+    def __init__(self, region):
+        self.region = region
+        self.session = requests.Session()
+        self.session.headers.update(region.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=region.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.rate_limiter = RateLimiter(region.rate_limit) if region.rate_limit else None
+        self.host = urlsplit(region.api_url).netloc
+
+    def request(self, method, path, endpoint=None, **kwargs):
+        """
+        Send a request to the target's API.
+
+        Parameters:
+        -----------
+        method : str
+            The HTTP method.
+        path : str
+            The path below the API URL, e.g. 'pipelines/12/position'.
+        endpoint : str, optional
+            The endpoint template the path belongs to, e.g. 'pipelines/{id}/position', so that
+            all calls to it share one circuit breaker. Defaults to the path itself.
+        **kwargs
+            Passed on to requests.
+
+        Returns:
+        --------
+        requests.Response
+            The API response.
+
+        Raises:
+        -------
+        CircuitOpenError
+            If the endpoint's circuit is open.
+        """
+        breaker = breaker_for(self.host, endpoint or path, self.region.breaker)
+        breaker.allow()
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        kwargs.setdefault('timeout', self.region.timeout)
+        try:
+            response = self.session.request(method, f"{self.region.api_url}/{path.lstrip('/')}", **kwargs)
+        except Exception as e:
+            breaker.record(False, f"{type(e).__name__}: {e}")
+            raise
+        if response.status_code >= 500:
+            breaker.record(False, f"HTTP {response.status_code}")
+        else:
+            breaker.record(True)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_for(region):
+    """
+    Return the client of a target, reusing it across sweeps and configuration reloads
+    for as long as the target's settings do not change.
+
+    Parameters:
+    -----------
+    region : Region
+        The target from the configuration.
+
+    Returns:
+    --------
+    HevoClient
+        The target's client.
+    """
+    with _clients_lock:
+        client = _clients.get(region.name)
+        if client is None or client.region != region:
+            if client is not None:
+                client.session.close()
+            client = _clients[region.name] = HevoClient(region)
+        return client
+
+
+def sweep(config, items, region_of, work, max_workers=None):
+    """
+    Run work(item, client) for every item, with all targets swept in parallel and each
+    target limited to its own concurrency.
+
+    Parameters:
+    -----------
+    config : Config
+        The active configuration.
+    items : list
+        The pipelines, objects or models to process.
+    region_of : callable
+        Returns the region name of an item.
+    work : callable
+        Called as work(item, client) for each item.
+    max_workers : int, optional
+        Lower cap on the number of parallel calls per target.
+
+    Returns:
+    --------
+    list
+        The results of work, in the order of items.
+    """
+    groups = {}
+    for index, item in enumerate(items):
+        groups.setdefault(region_of(item), []).append((index, item))
+
+    results = [None] * len(items)
+    executors = []
+    futures = []
+    try:
+        for name, group in groups.items():
+            region = config.region(name)
+            client = client_for(region)
+            workers = min(region.concurrency, max_workers or region.concurrency)
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"hevo-{region.name}")
+            executors.append(executor)
+            futures.extend((index, executor.submit(work, item, client)) for index, item in group)
+        for index, future in futures:
+            results[index] = future.result()
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+    return results
@@ -0,0 +1,236 @@
+"""
+Author: Hevo
+File  : lag_forecast.py
+
+Purpose:
+--------
+This module provides a lightweight per-pipeline lag estimator used by the lag alert scripts.
+Each pipeline keeps a fixed-size ring buffer of (sample time, lag) pairs and a least-squares
+linear fit over that window, so the scripts can warn before a lag threshold is crossed
+instead of after. Memory and work per sample are constant, whatever the number of pipelines.
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import json
+import os
+from array import array
+
+
+class LagRingBuffer:
+    """
+    Fixed-size ring buffer of lag samples with running sums for a linear fit.
+
+    The x axis is the sample time in seconds relative to the oldest sample in the
+    buffer (re-based every time the buffer wraps) so the sums stay small and precise.
+    """
+
+    __slots__ = ('size', 'times', 'lags', 'head', 'count', 'origin', 'sx', 'sy', 'sxx', 'sxy')
+
+    def __init__(self, size):
+        self.size = size
+        self.times = array('d', [0.0] * size)
+        self.lags = array('d', [0.0] * size)
+        self.head = 0
+        self.count = 0
+        self.origin = 0.0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def push(self, sample_time, lag_seconds):
+        """
+        Add a sample, evicting the oldest one when the buffer is full.
+
+        Parameters:
+        -----------
+        sample_time : float
+            Unix timestamp of the sample.
+        lag_seconds : float
+            Lag observed at that time, in seconds.
+        """
+        if self.count == 0:
+            self.origin = sample_time
+        elif self.count == self.size:
+            self._account(self.times[self.head], self.lags[self.head], -1.0)
+
+        self.times[self.head] = sample_time
+        self.lags[self.head] = lag_seconds
+        self._account(sample_time, lag_seconds, 1.0)
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+        if self.head == 0:
+            self._rebase()
+
+    def _account(self, sample_time, lag_seconds, sign):
+        x = sample_time - self.origin
+        self.sx += sign * x
+        self.sy += sign * lag_seconds
+        self.sxx += sign * x * x
+        self.sxy += sign * x * lag_seconds
+
+    def _rebase(self):
+        # Recomputing once per wrap keeps floating point drift bounded at O(1) amortised cost
+        self.origin = self.times[(self.head - self.count) % self.size]
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        for sample_time, lag_seconds in self.samples():
+            self._account(sample_time, lag_seconds, 1.0)
+
+    def samples(self):
+        """
+        Return the buffered samples, oldest first.
+
+        Returns:
+        --------
+        list of tuple
+            (sample_time, lag_seconds) pairs.
+        """
+        start = (self.head - self.count) % self.size
+        return [(self.times[(start + i) % self.size], self.lags[(start + i) % self.size])
+                for i in range(self.count)]
+
+    def latest(self):
+        """
+        Return the most recent sample as a (sample_time, lag_seconds) pair.
+        """
+        index = (self.head - 1) % self.size
+        return self.times[index], self.lags[index]
+
+    def slope(self):
+        """
+        Return the least-squares slope of lag over time (seconds of lag per second),
+        or None if the samples cannot be fitted.
+        """
+        n = self.count
+        denominator = n * self.sxx - self.sx * self.sx
+        if n < 2 or denominator <= 0:
+            return None
+        return (n * self.sxy - self.sx * self.sy) / denominator
+
+
+class LagForecaster:
+    """
+    Per-pipeline lag estimator predicting the time left before a lag threshold is crossed.
+
+    Parameters:
+    -----------
+    window : int
+        Number of samples kept per pipeline.
+    min_samples : int
+        Minimum number of samples required before a forecast is made.
+    """
+
+    def __init__(self, window=12, min_samples=3):
+        if window < 2:
+            raise ValueError("window must hold at least 2 samples")
+        self.window = window
+        self.min_samples = max(2, min_samples)
+        self.buffers = {}
+
+    def record(self, pipeline_id, sample_time, lag_seconds):
+        """
+        Record a lag sample for a pipeline.
+
+        Parameters:
+        -----------
+        pipeline_id : int or tuple
+            The ID of the pipeline, or its (region, ID) pair.
+        sample_time : float
+            Unix timestamp at which the lag was measured.
+        lag_seconds : float
+            The measured lag in seconds.
+        """
+        buffer = self.buffers.get(pipeline_id)
+        if buffer is None:
+            buffer = self.buffers[pipeline_id] = LagRingBuffer(self.window)
+        elif buffer.count and sample_time <= buffer.latest()[0]:
+            return  # Ignore duplicate or out-of-order samples
+        buffer.push(float(sample_time), float(lag_seconds))
+
+    def history(self, pipeline_id):
+        """
+        Return the recorded samples for a pipeline, oldest first.
+
+        Returns:
+        --------
+        list of tuple
+            (sample_time, lag_seconds) pairs, empty if the pipeline is unknown.
+        """
+        buffer = self.buffers.get(pipeline_id)
+        return buffer.samples() if buffer else []
+
+    def time_to_threshold(self, pipeline_id, threshold_seconds):
+        """
+        Predict how long until the pipeline's lag reaches the given threshold.
+
+        Parameters:
+        -----------
+        pipeline_id : int or tuple
+            The ID of the pipeline, or its (region, ID) pair.
+        threshold_seconds : float
+            The lag threshold in seconds.
+
+        Returns:
+        --------
+        float or None
+            Seconds until the threshold is reached, 0 if it already is, or None if
+            there are too few samples or the lag is not growing.
+        """
+        buffer = self.buffers.get(pipeline_id)
+        if buffer is None or buffer.count < self.min_samples:
+            return None
+
+        latest_lag = buffer.latest()[1]
+        if latest_lag >= threshold_seconds:
+            return 0.0
+
+        slope = buffer.slope()
+        if slope is None or slope <= 0:
+            return None
+        return (threshold_seconds - latest_lag) / slope
+
+    def load(self, path):
+        """
+        Load previously saved samples from a JSON file, if it exists.
+
+        Parameters:
+        -----------
+        path : str
+            Path of the JSON history file.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            state = json.load(f)
+        for pipeline_id, samples in state.items():
+            # (region, ID) pairs are saved as 'region/ID'
+            region, _, pipeline_id = pipeline_id.rpartition('/')
+            key = int(pipeline_id) if pipeline_id.isdigit() else pipeline_id
+            if region:
+                key = (region, key)
+            for sample_time, lag_seconds in samples[-self.window:]:
+                self.record(key, sample_time, lag_seconds)
+
+    def save(self, path):
+        """
+        Save the buffered samples to a JSON file so forecasts survive between runs.
+
+        Parameters:
+        -----------
+        path : str
+            Path of the JSON history file.
+        """
+        state = {}
+        for pipeline_id, buffer in self.buffers.items():
+            key = '/'.join(map(str, pipeline_id)) if isinstance(pipeline_id, tuple) else str(pipeline_id)
+            state[key] = buffer.samples()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
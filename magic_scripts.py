@@ -0,0 +1,106 @@
+"""
+Author: Hevo
+File  : magic_scripts.py
+
+Purpose:
+--------
+This script is a single entry point for the scripts in this repository. Each subcommand runs one
+script exactly as if it had been started directly, with the remaining arguments passed on to it,
+and nothing but the standard library is imported until a subcommand is chosen. Starting a lag
+check therefore never pays for loading BigQuery or MySQL, and `magic_scripts.py --help` returns
+without loading any script; `COMMAND --help` loads that command's script to list its options.
+
+    python magic_scripts.py lag --config config.toml              # email lag report, Gmail settings
+    python magic_scripts.py lag --via slack --interval 300        # Slack notifications
+    python magic_scripts.py restart --config config.toml --status failed
+    python magic_scripts.py run-models --config config.toml
+    python magic_scripts.py sync-columns
+    python magic_scripts.py mask export.jsonl masked.jsonl --fields email
+    python magic_scripts.py restart --help                        # options of a subcommand
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import argparse
+import runpy
+import sys
+
+# Scripts run by each lag notifier
+LAG_SCRIPTS = {
+    'gmail': 'gmail_lag_alert_notification',
+    'outlook': 'outlook_alert_notification',
+    'slack': 'postgres_alert_notification',
+}
+
+# Subcommand -> (script, help)
+COMMANDS = {
+    'lag': (None, "Check pipeline lag and notify by email or Slack"),
+    'restart': ('restart_multiple_objects', "Restart objects of Hevo pipelines"),
+    'run-models': ('run_multiple_models', "Trigger Hevo models"),
+    'sync-columns': ('empty_column_generator', "Add the columns missing from a BigQuery table"),
+    'mask': ('bulk_mask_data', "Mask fields of a large JSONL or CSV export"),
+}
+
+
+def build_parser():
+    """
+    Build the argument parser of the entry point. The options of each subcommand belong to its
+    script and are only parsed once the script is loaded.
+
+    Returns:
+    --------
+    argparse.ArgumentParser
+        The parser.
+    """
+    parser = argparse.ArgumentParser(prog='magic_scripts.py', description="Hevo self-service and monitoring scripts.",
+                                     epilog="Run '%(prog)s COMMAND --help' for the options of a command.")
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+    for command, (script, help_text) in COMMANDS.items():
+        # --help is left to the script, which knows the options of the command
+        subparser = subparsers.add_parser(command, help=help_text, add_help=False)
+        if command == 'lag':
+            subparser.add_argument('--via', choices=sorted(LAG_SCRIPTS), default='gmail',
+                                   help="How to notify: gmail or outlook email, or slack (default: %(default)s)")
+    return parser
+
+
+def run_script(script, prog, argv):
+    """
+    Run a script as __main__ with the given arguments.
+
+    Parameters:
+    -----------
+    script : str
+        The module name of the script, e.g. 'restart_multiple_objects'.
+    prog : str
+        The program name shown in the script's usage messages.
+    argv : list of str
+        The arguments passed on to the script.
+    """
+    sys.argv = [prog, *argv]
+    runpy.run_module(script, run_name='__main__')
+
+
+def main(argv=None):
+    """
+    Parse the subcommand and run its script.
+
+    Parameters:
+    -----------
+    argv : list of str, optional
+        The command line arguments, defaults to sys.argv[1:].
+    """
+    args, rest = build_parser().parse_known_args(argv)
+    script = LAG_SCRIPTS[args.via] if args.command == 'lag' else COMMANDS[args.command][0]
+    run_script(script, f"magic_scripts.py {args.command}", rest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Author: Hevo
+File  : notification_routing.py
+
+Purpose:
+--------
+This module routes lag check results to the recipients who own the pipelines, so that each
+recipient gets a report covering only their pipelines, and no report at all when none of
+their pipelines needs attention. Ownership comes from the 'owners' list of each pipeline in
+the configuration file; pipelines without owners are reported to every recipient.
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+from collections import namedtuple
+
+# Severities, in increasing order of urgency
+OK = 0
+EARLY_WARNING = 1
+WARNING = 2
+CRITICAL = 3
+ERROR = 4
+
+SEVERITY_NAMES = {OK: 'OK', EARLY_WARNING: 'Early warning', WARNING: 'Warning', CRITICAL: 'Critical', ERROR: 'Error'}
+
+# Outcome of a single lag check: lag is a timedelta, or None if the check failed, circuit names
+# the open circuit breaker that skipped the check, if any, and region is the region entry of the
+# pipeline, since pipeline IDs are only unique within an account
+LagCheck = namedtuple('LagCheck', ['pipeline_id', 'severity', 'lag', 'text', 'circuit', 'region'],
+                      defaults=(None, None))
+
+
+def is_actionable(check):
+    """
+    Return True if the check needs someone's attention.
+
+    Parameters:
+    -----------
+    check : LagCheck
+        The lag check result.
+
+    Returns:
+    --------
+    bool
+        True for early warnings, warnings, critical lag and errors.
+    """
+    return check.severity >= EARLY_WARNING
+
+
+def collapse_open_circuits(checks):
+    """
+    Replace the checks skipped by an open circuit breaker with one summary per circuit, so an
+    outage is reported once instead of as an identical error for every pipeline.
+
+    Parameters:
+    -----------
+    checks : list of LagCheck
+        The results of a sweep.
+
+    Returns:
+    --------
+    list of LagCheck
+        The checks that ran, followed by one ERROR check per open circuit. Summaries have no
+        pipeline ID and are routed to every recipient.
+    """
+    ran = []
+    skipped = {}
+    for check in checks:
+        if check.circuit:
+            skipped.setdefault(check.circuit, []).append(check.pipeline_id)
+        else:
+            ran.append(check)
+    for circuit, pipeline_ids in skipped.items():
+        text = (f"Circuit breaker open for {circuit}: skipped {len(pipeline_ids)} pipelines "
+                f"({', '.join(str(pipeline_id) for pipeline_id in pipeline_ids)})\n")
+        ran.append(LagCheck(None, ERROR, None, text, circuit))
+    return ran
+
+
+def route_checks(checks, config):
+    """
+    Group lag checks by the recipients who own the pipelines.
+
+    Parameters:
+    -----------
+    checks : list of LagCheck
+        The results of a sweep, in report order.
+    config : Config
+        The active configuration, whose routing index maps pipelines to recipients.
+
+    Returns:
+    --------
+    dict
+        Primary recipient -> list of LagCheck for their pipelines. Recipients with nothing
+        actionable are left out.
+    """
+    routed = {}
+    actionable = set()
+    for check in checks:
+        for recipient in config.recipients_for(check.pipeline_id, check.region):
+            routed.setdefault(recipient, []).append(check)
+            if is_actionable(check):
+                actionable.add(recipient)
+    return {recipient: routed[recipient] for recipient in routed if recipient in actionable}
+
+
+def render_text_body(checks, intro):
+    """
+    Render a plain-text report from a recipient's subset of lag checks.
+
+    Parameters:
+    -----------
+    checks : list of LagCheck
+        The lag checks to include.
+    intro : str
+        The opening line of the report.
+
+    Returns:
+    --------
+    str
+        The report body.
+    """
+    return f"{intro}\n\n" + "\n".join(check.text for check in checks)
@@ -0,0 +1,347 @@
+"""
+Author: Hevo
+File  : outbox.py
+
+Purpose:
+--------
+This module keeps the notifications of the alert scripts in a durable local outbox, so that a
+lag sweep only has to queue its emails and Slack messages and is never held up by a slow SMTP
+server or webhook. The outbox is a SQLite database in WAL mode: queuing is a single insert, and
+a delivery worker can drain it from another thread or another process at the same time.
+
+OutboxWorker delivers the queued notifications in batches, one batch per channel at a time, so a
+batch of emails shares one SMTP session. A failed notification is retried with exponential
+backoff and given up on ('dead') after MAX_ATTEMPTS. Notifications claimed by a worker that dies
+before finishing are picked up again once their lease expires, so nothing queued is lost across
+restarts; in that case a notification may be delivered twice, never zero times.
+
+Usage Documentation:
+--------------------
+https://www.sqlite.org/wal.html
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+
+BATCH_SIZE = 50             # Notifications handed to a channel's delivery function at once
+MAX_ATTEMPTS = 8            # Attempts before a notification is marked dead
+BASE_DELAY = 5.0            # Seconds before the first retry, doubled for every further attempt
+MAX_DELAY = 600.0           # Longest wait between two attempts
+LEASE_SECONDS = 300.0       # Claimed notifications are retried if not delivered within this time
+DRAIN_TIMEOUT = 60.0        # Seconds a one-off run waits for its notifications to be delivered
+KEEP_SENT_DAYS = 7          # Delivered notifications are deleted after this many days
+
+
+class Outbox:
+    """
+    Durable queue of notifications, stored in SQLite. The database is created on first use.
+
+    Parameters:
+    -----------
+    path : str
+        Path of the SQLite database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS notifications ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " channel TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt_at REAL NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " sent_at REAL,"
+                " last_error TEXT)")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS notifications_due ON notifications (status, next_attempt_at)")
+        return self.connection
+
+    def enqueue(self, channel, payload):
+        """
+        Queue a notification.
+
+        Parameters:
+        -----------
+        channel : str
+            The delivery channel, e.g. 'email' or 'slack'.
+        payload : dict
+            JSON-serialisable contents, passed back to the channel's delivery function.
+
+        Returns:
+        --------
+        int
+            The ID of the queued notification.
+        """
+        now = time.time()
+        with self.lock:
+            cursor = self._connect().execute(
+                "INSERT INTO notifications (channel, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (channel, json.dumps(payload), now, now))
+        self.wakeup.set()
+        return cursor.lastrowid
+
+    def claim(self, channel, limit=BATCH_SIZE, lease=LEASE_SECONDS):
+        """
+        Take the oldest due notifications of a channel for delivery.
+
+        Parameters:
+        -----------
+        channel : str
+            The delivery channel.
+        limit : int
+            Maximum number of notifications to claim.
+        lease : float
+            Seconds after which the notifications are due again if neither marked sent nor failed.
+
+        Returns:
+        --------
+        list of tuple
+            (id, attempts, payload) of each claimed notification.
+        """
+        now = time.time()
+        with self.lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    "SELECT id, attempts, payload FROM notifications"
+                    " WHERE channel = ? AND status IN ('pending', 'sending') AND next_attempt_at <= ?"
+                    " ORDER BY next_attempt_at, id LIMIT ?", (channel, now, limit)).fetchall()
+                connection.executemany(
+                    "UPDATE notifications SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?"
+                    " WHERE id = ?", [(now + lease, row[0]) for row in rows])
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return [(row[0], row[1] + 1, json.loads(row[2])) for row in rows]
+
+    def mark_sent(self, notification_ids):
+        """
+        Record the successful delivery of claimed notifications.
+
+        Parameters:
+        -----------
+        notification_ids : list of int
+            The delivered notifications.
+        """
+        now = time.time()
+        with self.lock:
+            self._connect().executemany(
+                "UPDATE notifications SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                [(now, notification_id) for notification_id in notification_ids])
+
+    def mark_failed(self, notification_id, error, retry_at=None):
+        """
+        Record a failed delivery attempt.
+
+        Parameters:
+        -----------
+        notification_id : int
+            The notification that failed.
+        error : str
+            Description of the failure.
+        retry_at : float, optional
+            When to try again, as a Unix timestamp. The notification is marked dead if not given.
+        """
+        with self.lock:
+            if retry_at is None:
+                self._connect().execute("UPDATE notifications SET status = 'dead', last_error = ? WHERE id = ?",
+                                        (error, notification_id))
+            else:
+                self._connect().execute(
+                    "UPDATE notifications SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (retry_at, error, notification_id))
+
+    def channels(self):
+        """
+        Return the channels that have notifications waiting for delivery.
+        """
+        with self.lock:
+            rows = self._connect().execute(
+                "SELECT DISTINCT channel FROM notifications WHERE status IN ('pending', 'sending')").fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self):
+        """
+        Return the number of notifications in each status.
+
+        Returns:
+        --------
+        dict
+            Status -> count, e.g. {'pending': 2, 'sent': 40}.
+        """
+        with self.lock:
+            return dict(self._connect().execute("SELECT status, COUNT(*) FROM notifications GROUP BY status"))
+
+    def purge(self, older_than):
+        """
+        Delete delivered notifications sent more than `older_than` seconds ago.
+
+        Returns:
+        --------
+        int
+            The number of notifications deleted.
+        """
+        with self.lock:
+            cursor = self._connect().execute("DELETE FROM notifications WHERE status = 'sent' AND sent_at < ?",
+                                             (time.time() - older_than,))
+        return cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+class OutboxWorker:
+    """
+    Delivers the notifications of an outbox, in the calling thread or in a background thread.
+
+    Parameters:
+    -----------
+    outbox : Outbox
+        The outbox to drain.
+    handlers : dict
+        Channel -> delivery function. The function is called with a list of payloads and returns
+        a list of the same length holding None for each delivered payload and an error message
+        for each failed one. If it raises, the whole batch counts as failed.
+    batch_size : int
+        Maximum number of payloads per call of a delivery function.
+    max_attempts : int
+        Attempts before a notification is marked dead.
+    base_delay, max_delay : float
+        Backoff between attempts, in seconds.
+    """
+
+    def __init__(self, outbox, handlers, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.outbox = outbox
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def retry_at(self, attempts):
+        """
+        Return when to retry a notification after its given number of failed attempts, with jitter
+        so that retries of a batch do not all land at once. None once it should be given up on.
+        """
+        if attempts >= self.max_attempts:
+            return None
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return time.time() + delay * random.uniform(0.5, 1.0)
+
+    def deliver_batch(self, channel):
+        """
+        Claim and deliver one batch of a channel's due notifications.
+
+        Returns:
+        --------
+        int
+            The number of notifications claimed, 0 when none were due.
+        """
+        batch = self.outbox.claim(channel, self.batch_size)
+        if not batch:
+            return 0
+        try:
+            errors = self.handlers[channel]([payload for _, _, payload in batch])
+        except Exception as e:
+            errors = [f"{type(e).__name__}: {e}"] * len(batch)
+
+        self.outbox.mark_sent([notification_id for (notification_id, _, _), error in zip(batch, errors) if not error])
+        for (notification_id, attempts, _), error in zip(batch, errors):
+            if error:
+                retry_at = self.retry_at(attempts)
+                self.outbox.mark_failed(notification_id, error, retry_at)
+                if retry_at is None:
+                    print(f"Giving up on {channel} notification {notification_id} after {attempts} attempts: {error}")
+        return len(batch)
+
+    def deliver_due(self):
+        """
+        Deliver every notification that is due, batch after batch.
+
+        Returns:
+        --------
+        int
+            The number of notifications attempted.
+        """
+        attempted = 0
+        for channel in self.outbox.channels():
+            if channel not in self.handlers:
+                continue
+            while True:
+                count = self.deliver_batch(channel)
+                attempted += count
+                if count < self.batch_size:
+                    break
+        return attempted
+
+    def run(self, poll_interval=1.0):
+        """
+        Keep delivering until stop() is called, waking up as soon as a notification is queued
+        through the same Outbox object, and at least every `poll_interval` seconds otherwise.
+        """
+        while True:
+            self.outbox.wakeup.clear()
+            attempted = self.deliver_due()
+            if self.stopping.is_set() and not attempted:
+                return
+            if not attempted:
+                self.outbox.wakeup.wait(poll_interval)
+
+    def start(self, poll_interval=1.0):
+        """
+        Start delivering from a background thread.
+
+        Returns:
+        --------
+        OutboxWorker
+            The worker itself.
+        """
+        self.thread = threading.Thread(target=self.run, args=(poll_interval,), name='outbox-worker', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=DRAIN_TIMEOUT):
+        """
+        Deliver what is due, then stop the background thread. Notifications still waiting for a
+        retry, or not delivered within the timeout, stay in the outbox for the next run. Old
+        delivered notifications are deleted.
+
+        Returns:
+        --------
+        int
+            The number of notifications left in the outbox.
+        """
+        self.stopping.set()
+        self.outbox.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout)
+        self.outbox.purge(KEEP_SENT_DAYS * 86400)
+        counts = self.outbox.counts()
+        return counts.get('pending', 0) + counts.get('sending', 0)
@@ -1,4 +1,3 @@
-outlook_alert_notification.py
 """
 Author: Hevo
 File  : outlook_alert_notification.py
@@ -18,19 +17,29 @@ This script has no license. It is provided "as-is" without any warranty. Feel fr
 and modify it for any purpose.
 """
 
+import argparse
 import smtplib
+import time
+from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from datetime import datetime, timedelta
 import pytz
 from dateutil import parser
-import requests
+from lag_forecast import LagForecaster
+from instrumentation import span, timed
+from config_loader import ConfigReloader, compile_config
+from hevo_client import CircuitOpenError, client_for, sweep
+from email_templates import render_html_digest
+from outbox import DRAIN_TIMEOUT, Outbox, OutboxWorker
+from notification_routing import CRITICAL, EARLY_WARNING, ERROR, OK, WARNING, LagCheck, collapse_open_circuits, render_text_body, route_checks
 
 # Email configuration
 SMTP_SERVER = 'smtp.gmail.com'          # For Outlook use smtp.office365.com
 SMTP_PORT = 587                         # Port would be the same for Outlook
 SMTP_USER = '<your_email_id>'           # Add your email ID
 SMTP_PASSWORD = '<your_password>'       # Add your password
+SMTP_TIMEOUT = 30                       # Seconds before a stalled SMTP connection is abandoned
 
 # Dictionary of primary recipients and their CC recipients
 EMAIL_DICT = {
@@ -54,7 +63,44 @@ tzinfos = {
     # Add other timezones if needed
 }
 
-def get_pipeline_position(pipeline_id):
+# Pipelines to check when no configuration file is given
+PIPELINE_IDS = [162, 548]  # Example pipeline IDs
+
+# Lag thresholds and forecasting
+WARNING_LAG = timedelta(minutes=100)
+CRITICAL_LAG = timedelta(hours=12)
+FORECAST_HORIZON = timedelta(hours=1)           # Warn early if a threshold is forecast to be crossed within this time
+LAG_HISTORY_FILE = 'outlook_lag_history.json'   # Lag samples are kept here between runs
+forecaster = LagForecaster(window=12)
+
+# Emails are queued here and delivered by a worker, so a slow SMTP server never holds up a sweep
+OUTBOX_FILE = 'outlook_outbox.sqlite'
+outbox = Outbox(OUTBOX_FILE)
+
+def default_config():
+    """
+    Build the configuration from the constants above, used when no configuration file is given.
+
+    Returns:
+    --------
+    Config
+        The compiled configuration.
+    """
+    return compile_config({
+        'smtp': {'server': SMTP_SERVER, 'port': SMTP_PORT, 'user': SMTP_USER, 'password': SMTP_PASSWORD},
+        'recipients': EMAIL_DICT,
+        'regions': {'default': {'api_url': base_url.rsplit('/pipelines', 1)[0], 'headers': headers}},
+        'timezones': {name: offset / 3600 for name, offset in tzinfos.items()},
+        'thresholds': {'warning_minutes': WARNING_LAG.total_seconds() / 60,
+                       'critical_minutes': CRITICAL_LAG.total_seconds() / 60},
+        'pipelines': PIPELINE_IDS,
+    })
+
+# Active configuration, replaced by --config and refreshed when the file changes
+config = default_config()
+
+@timed()
+def get_pipeline_position(pipeline_id, client=None, region=None):
     """
     Fetch the display position of a given pipeline.
 
@@ -62,6 +108,10 @@ def get_pipeline_position(pipeline_id):
     -----------
     pipeline_id : int
         The ID of the pipeline.
+    client : HevoClient, optional
+        The client of the pipeline's region, looked up if not given.
+    region : str, optional
+        The region entry of the pipeline, defaults to the default region.
 
     Returns:
     --------
@@ -73,8 +123,9 @@ def get_pipeline_position(pipeline_id):
     ValueError:
         If the API response does not contain the 'data' key.
     """
-    url = f'{base_url}/{pipeline_id}/position'
-    response = requests.get(url, headers=headers)
+    if client is None:
+        client = client_for(config.region(region))
+    response = client.get(f'pipelines/{pipeline_id}/position', endpoint='pipelines/{id}/position')
     response_data = response.json()
 
     if 'data' not in response_data:
@@ -98,6 +149,7 @@ def clean_timestamp(timestamp_str):
     """
     return timestamp_str.split("EDT,")[0].strip()
 
+@timed()
 def parse_timestamp(timestamp_str):
     """
     Parse the cleaned timestamp string into a datetime object.
@@ -112,9 +164,9 @@ def parse_timestamp(timestamp_str):
     datetime
         The parsed datetime object.
     """
-    return parser.parse(timestamp_str, tzinfos=tzinfos)
+    return parser.parse(timestamp_str, tzinfos=config.tzinfos)
 
-def check_lag(pipeline_id):
+def check_lag(pipeline_id, client=None, region=None):
     """
     Check for the lag in the pipeline processing based on the current time.
 
@@ -122,18 +174,25 @@ def check_lag(pipeline_id):
     -----------
     pipeline_id : int
         The ID of the pipeline.
+    client : HevoClient, optional
+        The client of the pipeline's region, looked up if not given.
+    region : str, optional
+        The region entry of the pipeline, defaults to the default region.
 
     Returns:
     --------
-    str
-        A message describing the lag status of the pipeline.
+    LagCheck
+        The severity and lag of the pipeline, with a message describing its lag status.
     """
     try:
-        display_position = get_pipeline_position(pipeline_id)
-        print(f"Display Position: {display_position}")  # Debugging line
-
+        settings = config.pipeline(pipeline_id, region)
+        region = settings.region
+        display_position = get_pipeline_position(pipeline_id, client, region)
         timestamp_str = clean_timestamp(display_position)
-        print(f"Cleaned Timestamp: {timestamp_str}")  # Debugging line
+
+        # Debugging: a single print keeps the lines of one pipeline together when regions are swept in parallel
+        print(f"Pipeline ID: {pipeline_id}\nRegion: {region}\nDisplay Position: {display_position}\n"
+              f"Cleaned Timestamp: {timestamp_str}")
 
         timestamp = parse_timestamp(timestamp_str)
 
@@ -146,42 +205,79 @@ def check_lag(pipeline_id):
         current_time = datetime.now(pytz.timezone('America/New_York'))
 
         lag = current_time - timestamp
+        forecaster.record((region, pipeline_id), current_time.timestamp(), lag.total_seconds())
 
-        result = f"Pipeline ID: {pipeline_id}\nTimestamp: {timestamp_str}\nCurrent Time: {current_time}\nLag: {lag}\n"
+        result = f"Pipeline ID: {pipeline_id}\nRegion: {region}\nTimestamp: {timestamp_str}\nCurrent Time: {current_time}\nLag: {lag}\n"
 
-        if lag > timedelta(hours=12):
+        if lag > settings.critical_lag:
+            severity = CRITICAL
             result += f"Warning: Pipeline {pipeline_id} has a lag of {lag.total_seconds() / 3600:.2f} hours.\n"
-        elif lag > timedelta(minutes=100):
+        elif lag > settings.warning_lag:
+            severity = WARNING
             result += f"Warning: Pipeline {pipeline_id} has a lag of {lag.total_seconds() / 60:.2f} minutes.\n"
+            result += forecast_warning(pipeline_id, settings.critical_lag, region)
         else:
+            early_warning = forecast_warning(pipeline_id, settings.warning_lag, region)
+            severity = EARLY_WARNING if early_warning else OK
             result += f"Pipeline {pipeline_id} is running smoothly with a lag of {lag.total_seconds() / 60:.2f} minutes.\n"
-        return result
+            result += early_warning
+        return LagCheck(pipeline_id, severity, lag, result, region=region)
+    except CircuitOpenError as e:
+        return LagCheck(pipeline_id, ERROR, None, f"Skipped pipeline {pipeline_id}: {e}\n", e.breaker.name, region)
     except Exception as e:
-        return f"Error processing pipeline {pipeline_id}: {e}\n"
+        return LagCheck(pipeline_id, ERROR, None, f"Error processing pipeline {pipeline_id}: {e}\n", region=region)
 
-def main(pipeline_ids):
+def forecast_warning(pipeline_id, threshold, region):
     """
-    Main function to check lags for multiple pipelines and return the results.
+    Build an early warning line if the pipeline's lag is forecast to cross the threshold soon.
 
     Parameters:
     -----------
-    pipeline_ids : list of int
-        A list of pipeline IDs to check.
+    pipeline_id : int
+        The ID of the pipeline.
+    threshold : timedelta
+        The lag threshold to forecast against.
+    region : str
+        The region entry of the pipeline.
 
     Returns:
     --------
     str
-        A concatenated string of lag status messages for each pipeline.
+        The early warning line, or an empty string if no warning is needed.
     """
-    results = []
-    for pipeline_id in pipeline_ids:
-        result = check_lag(pipeline_id)
-        results.append(result)
-    return "\n".join(results)
+    eta = forecaster.time_to_threshold((region, pipeline_id), threshold.total_seconds())
+    if eta is None or eta > FORECAST_HORIZON.total_seconds():
+        return ""
+    return (f"Early warning: Pipeline {pipeline_id} is forecast to cross the {threshold} lag threshold "
+            f"in {eta / 60:.2f} minutes.\n")
 
-def send_email(to_email, cc_list, subject, body):
+def main(pipelines):
     """
-    Send an email notification with the given subject and body.
+    Main function to check lags for multiple pipelines and return the results.
+
+    Parameters:
+    -----------
+    pipelines : list of tuple
+        The (region, pipeline ID) pairs to check, as keyed in config.pipelines.
+
+    Returns:
+    --------
+    list of LagCheck
+        The lag status of each pipeline, in the given order.
+    """
+    if not forecaster.buffers:
+        forecaster.load(LAG_HISTORY_FILE)
+    # Regions are swept in parallel, each with its own connection pool and rate limit
+    results = sweep(config, pipelines, lambda pipeline: pipeline[0],
+                    lambda pipeline, client: check_lag(pipeline[1], client, pipeline[0]))
+    forecaster.save(LAG_HISTORY_FILE)
+    # Pipelines skipped by an open circuit breaker are summarised once per circuit
+    return collapse_open_circuits(results)
+
+def send_email(to_email, cc_list, subject, body, html=None, images=None):
+    """
+    Queue an email notification with the given subject and body. It is sent by
+    deliver_emails(), run by the outbox worker.
 
     Parameters:
     -----------
@@ -193,36 +289,109 @@ def send_email(to_email, cc_list, subject, body):
         The subject of the email.
     body : str
         The body of the email.
+    html : str, optional
+        An HTML version of the body, sent alongside the plain text.
+    images : dict, optional
+        Inline images referenced by the HTML, as Content-ID -> PNG bytes.
 
     Returns:
     --------
     None
     """
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USER
-        msg['To'] = to_email
-        msg['Cc'] = ', '.join(cc_list)
-        msg['Subject'] = subject
-
+    msg = MIMEMultipart('related' if html else 'mixed')
+    msg['From'] = config.smtp.user
+    msg['To'] = to_email
+    msg['Cc'] = ', '.join(cc_list)
+    msg['Subject'] = subject
+
+    if html:
+        alternative = MIMEMultipart('alternative')
+        alternative.attach(MIMEText(body, 'plain'))
+        alternative.attach(MIMEText(html, 'html'))
+        msg.attach(alternative)
+        for cid, png in (images or {}).items():
+            image = MIMEImage(png, 'png')
+            image.add_header('Content-ID', f'<{cid}>')
+            image.add_header('Content-Disposition', 'inline')
+            msg.attach(image)
+    else:
         msg.attach(MIMEText(body, 'plain'))
 
-        # Combine primary recipient and CC recipients
-        all_recipients = [to_email] + cc_list
+    # Combine primary recipient and CC recipients
+    all_recipients = [to_email] + list(cc_list)
+    outbox.enqueue('email', {'recipients': all_recipients, 'message': msg.as_string()})
+
+@timed()
+def deliver_emails(emails):
+    """
+    Send a batch of queued emails over a single SMTP session.
+
+    Parameters:
+    -----------
+    emails : list of dict
+        The queued emails, with the 'recipients' and the 'message' to send.
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+    Returns:
+    --------
+    list
+        None for each email sent, or the error that kept it from being sent.
+    """
+    smtp = config.smtp
+    errors = []
+    with smtplib.SMTP(smtp.server, smtp.port, timeout=SMTP_TIMEOUT) as server:
+        with span('send_email.smtp_login'):
             server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_USER, all_recipients, msg.as_string())
-        print(f"Notification sent to {to_email} with CC to {', '.join(cc_list)}")
-    except Exception as e:
-        print(f"Failed to send email to {to_email}: {e}")
+            server.login(smtp.user, smtp.password)
+        for email in emails:
+            try:
+                server.sendmail(smtp.user, email['recipients'], email['message'])
+                print(f"Notification sent to {', '.join(email['recipients'])}")
+                errors.append(None)
+            except smtplib.SMTPException as e:
+                print(f"Failed to send email to {', '.join(email['recipients'])}: {e}")
+                errors.append(f"{type(e).__name__}: {e}")
+    return errors
 
 if __name__ == "__main__":
-    subject = "Hevo Lag-Alert Notification System Results"
-    pipeline_ids = [162, 548]  # Example pipeline IDs
-    results = main(pipeline_ids)
-    body = f"Please find below the results of the Hevo Lag-Alert Notification System:\n\n{results}"
+    arg_parser = argparse.ArgumentParser(description="Check Hevo pipeline lag and email the results.")
+    arg_parser.add_argument('--config', help="YAML or TOML configuration file to use instead of the constants above")
+    arg_parser.add_argument('--interval', type=float, default=0,
+                            help="Keep running, checking every INTERVAL seconds and reloading the configuration file when it changes")
+    arg_parser.add_argument('--no-deliver', action='store_true',
+                            help="Only queue the emails, for a separate worker started with --deliver-only")
+    arg_parser.add_argument('--deliver-only', action='store_true',
+                            help="Only send the queued emails and exit, or keep sending them with --interval")
+    args = arg_parser.parse_args()
+
+    reloader = ConfigReloader(args.config) if args.config else None
+    if reloader:
+        config = reloader.current()
+    worker = OutboxWorker(outbox, {'email': deliver_emails})
+    if not (args.no_deliver or args.deliver_only):
+        worker.start()
 
-    for primary, cc_list in EMAIL_DICT.items():
-        send_email(primary, cc_list, subject, body)
\ No newline at end of file
+    subject = "Hevo Lag-Alert Notification System Results"
+    while True:
+        if reloader:
+            config = reloader.current()
+        if args.deliver_only:
+            # Runs as the outbox's delivery worker, independently of the sweeps
+            worker.deliver_due()
+        else:
+            results = main(list(config.pipelines))
+
+            # Each recipient only hears about the pipelines they own, and only if one of them needs attention
+            intro = "Please find below the results of the Hevo Lag-Alert Notification System:"
+            for primary, checks in route_checks(results, config).items():
+                body = render_text_body(checks, intro)
+                html, images = render_html_digest(checks, forecaster, intro)
+                send_email(primary, config.recipients.get(primary, ()), subject, body, html, images)
+
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+    if worker.thread:
+        queued = worker.stop(DRAIN_TIMEOUT)
+        if queued:
+            print(f"{queued} emails are still queued in {OUTBOX_FILE} and will be retried on the next run")
\ No newline at end of file
@@ -17,11 +17,18 @@ This script has no license. It is provided "as-is" without any warranty. Feel fr
 and modify it for any purpose.
 """
 
+import argparse
+import time
 import requests
 from datetime import datetime, timedelta
 import pytz
 import json
 from dateutil import parser
+from lag_forecast import LagForecaster
+from instrumentation import timed
+from config_loader import ConfigReloader, compile_config
+from hevo_client import CircuitOpenError, breaker_report, client_for, sweep
+from outbox import DRAIN_TIMEOUT, Outbox, OutboxWorker
 
 # Slack webhook URL
 slack_webhook_url = '<YOUR_SLACK_URL>'
@@ -43,8 +50,45 @@ tzinfos = {
 # AEDT (Australian Eastern Daylight Time) is UTC+11
 }
 
+# Pipelines to check when no configuration file is given
+PIPELINE_IDS = [75, 63]  # You can add more pipelines here
 
-def get_pipeline_position(pipeline_id):
+# Lag threshold and forecasting
+LAG_THRESHOLD = timedelta(hours=12)
+FORECAST_HORIZON = timedelta(hours=1)           # Notify early if the threshold is forecast to be crossed within this time
+LAG_HISTORY_FILE = 'postgres_lag_history.json'  # Lag samples are kept here between runs
+forecaster = LagForecaster(window=12)
+
+# Reused across sweeps so that long-running mode keeps its Slack connection open
+session = requests.Session()
+
+# Slack messages are queued here and delivered by a worker, so a slow webhook never holds up a sweep
+OUTBOX_FILE = 'postgres_outbox.sqlite'
+outbox = Outbox(OUTBOX_FILE)
+
+def default_config():
+    """
+    Builds the configuration from the constants above, used when no configuration file is given.
+
+    Returns:
+    --------
+    Config
+        The compiled configuration.
+    """
+    return compile_config({
+        'slack_webhook_url': slack_webhook_url,
+        'regions': {'default': {'api_url': base_url.rsplit('/pipelines', 1)[0], 'headers': headers}},
+        'timezones': {name: offset / 3600 for name, offset in tzinfos.items()},
+        'thresholds': {'critical_minutes': LAG_THRESHOLD.total_seconds() / 60},
+        'pipelines': PIPELINE_IDS,
+    })
+
+# Active configuration, replaced by --config and refreshed when the file changes
+config = default_config()
+
+
+@timed()
+def get_pipeline_position(pipeline_id, client=None, region=None):
     """
     Fetches the display position of the given pipeline from the Hevo API.
 
@@ -52,6 +96,10 @@ def get_pipeline_position(pipeline_id):
     -----------
     pipeline_id : int
         The ID of the pipeline.
+    client : HevoClient, optional
+        The client of the pipeline's region, looked up if not given.
+    region : str, optional
+        The region entry of the pipeline, defaults to the default region.
 
     Returns:
     --------
@@ -63,8 +111,9 @@ def get_pipeline_position(pipeline_id):
     ValueError
         If the response does not contain the 'data' key.
     """
-    url = f'{base_url}/{pipeline_id}/position'
-    response = requests.get(url, headers=headers)
+    if client is None:
+        client = client_for(config.region(region))
+    response = client.get(f'pipelines/{pipeline_id}/position', endpoint='pipelines/{id}/position')
     response_data = response.json()
 
     if 'data' not in response_data:
@@ -72,6 +121,7 @@ def get_pipeline_position(pipeline_id):
 
     return response_data['data']['display_position']
 
+@timed()
 def parse_timestamp(timestamp_str):
     """
     Parses a timestamp string into a datetime object with timezone information.
@@ -87,16 +137,21 @@ def parse_timestamp(timestamp_str):
         A datetime object with timezone information.
     """
     # Parse datetime with timezone abbreviation using dateutil.parser and tzinfos
-    return parser.parse(timestamp_str, tzinfos=tzinfos)
+    return parser.parse(timestamp_str, tzinfos=config.tzinfos)
 
-def check_lag_and_notify(pipeline_id):
+def check_lag_and_notify(pipeline_id, client=None, region=None):
     """
-    Checks the lag for a given pipeline and sends a Slack notification if the lag exceeds 12 hours.
+    Checks the lag for a given pipeline and sends a Slack notification if the lag exceeds 12 hours,
+    or if it is forecast to exceed 12 hours within the forecast horizon.
 
     Parameters:
     -----------
     pipeline_id : int
         The ID of the pipeline to check.
+    client : HevoClient, optional
+        The client of the pipeline's region, looked up if not given.
+    region : str, optional
+        The region entry of the pipeline, defaults to the default region.
 
     Returns:
     --------
@@ -107,8 +162,9 @@ def check_lag_and_notify(pipeline_id):
     Exception
         If there is any error processing the pipeline.
     """
+    settings = config.pipeline(pipeline_id, region)
     try:
-        display_position = get_pipeline_position(pipeline_id)
+        display_position = get_pipeline_position(pipeline_id, client, settings.region)
         timestamp_str = display_position.split(", Seq No")[0].strip()
         timestamp = parse_timestamp(timestamp_str)
 
@@ -122,20 +178,27 @@ def check_lag_and_notify(pipeline_id):
         # Convert current_time to UTC before subtracting to avoid timezone issues
         current_time_utc = current_time.astimezone(pytz.utc)
         lag = current_time_utc - timestamp
-
-        print(f"Pipeline ID: {pipeline_id}")
-        print(f"Timestamp: {timestamp_str}")
-        print(f"Current Time: {current_time}")
-        print(f"Lag: {lag}")
-
-        if lag > timedelta(hours=12):
-            notify_slack(pipeline_id, lag)
+        forecaster.record((settings.region, pipeline_id), current_time_utc.timestamp(), lag.total_seconds())
+
+        # A single print keeps the lines of one pipeline together when regions are swept in parallel
+        print(f"Pipeline ID: {pipeline_id}\nRegion: {settings.region}\nTimestamp: {timestamp_str}\nCurrent Time: {current_time}\nLag: {lag}")
+
+        threshold = settings.critical_lag
+        if lag > threshold:
+            notify_slack(pipeline_id, lag, region=settings.region)
+        else:
+            eta = forecaster.time_to_threshold((settings.region, pipeline_id), threshold.total_seconds())
+            if eta is not None and eta <= FORECAST_HORIZON.total_seconds():
+                notify_slack(pipeline_id, lag, eta, settings.region)
+    except CircuitOpenError:
+        pass  # Reported once per circuit by main()
     except Exception as e:
         print(f"Error processing pipeline {pipeline_id}: {e}")
 
-def notify_slack(pipeline_id, lag):
+def notify_slack(pipeline_id, lag, eta=None, region=None):
     """
-    Sends a notification to Slack if a pipeline's lag exceeds the threshold.
+    Queues a Slack notification for a pipeline whose lag exceeds, or is forecast to exceed, the threshold.
+    It is posted by deliver_slack(), run by the outbox worker.
 
     Parameters:
     -----------
@@ -143,46 +206,107 @@ def notify_slack(pipeline_id, lag):
         The ID of the pipeline.
     lag : timedelta
         The amount of lag.
+    eta : float, optional
+        Forecast seconds until the threshold is crossed, for early warnings.
+    region : str, optional
+        The region entry of the pipeline, defaults to the default region.
 
     Returns:
     --------
     None
-
-    Raises:
-    -------
-    ValueError
-        If the Slack notification fails to send.
     """
-    message = f"Pipeline {pipeline_id} has a lag of {lag.total_seconds() / 3600:.2f} hours."
-    payload = {
-        'text': message
-    }
-    response = requests.post(slack_webhook_url, data=json.dumps(payload), headers={'Content-Type': 'application/json'})
-    if response.status_code != 200:
-        raise ValueError(f'Failed to send message to Slack: {response.text}')
+    settings = config.pipeline(pipeline_id, region)
+    message = f"Pipeline {pipeline_id} ({settings.region}) has a lag of {lag.total_seconds() / 3600:.2f} hours."
+    if eta is not None:
+        threshold = settings.critical_lag
+        message += f" It is forecast to cross the {threshold} lag threshold in {eta / 60:.2f} minutes."
+    outbox.enqueue('slack', {'text': message})
+
+@timed()
+def deliver_slack(payloads):
+    """
+    Posts a batch of queued Slack notifications to the webhook, over one connection.
 
-def main(pipeline_ids):
+    Parameters:
+    -----------
+    payloads : list of dict
+        The queued Slack messages.
+
+    Returns:
+    --------
+    list
+        None for each message posted, or the error that kept it from being posted.
+    """
+    errors = []
+    for payload in payloads:
+        try:
+            response = session.post(config.slack_webhook_url, data=json.dumps(payload),
+                                    headers={'Content-Type': 'application/json'}, timeout=30)
+            errors.append(None if response.status_code == 200 else
+                          f'Failed to send message to Slack: HTTP {response.status_code} {response.text}')
+        except requests.RequestException as e:
+            errors.append(f'Failed to send message to Slack: {e}')
+    return errors
+
+def main(pipelines):
     """
     Main function to check the lag for a list of pipelines and notify if necessary.
 
     Parameters:
     -----------
-    pipeline_ids : list of int
-        The list of pipeline IDs to check.
+    pipelines : list of tuple
+        The (region, pipeline ID) pairs to check, as keyed in config.pipelines.
 
     Returns:
     --------
     None
     """
-    for pipeline_id in pipeline_ids:
-        check_lag_and_notify(pipeline_id)
+    if not forecaster.buffers:
+        forecaster.load(LAG_HISTORY_FILE)
+    # Regions are swept in parallel, each with its own connection pool and rate limit
+    sweep(config, pipelines, lambda pipeline: pipeline[0],
+          lambda pipeline, client: check_lag_and_notify(pipeline[1], client, pipeline[0]))
+    for line in breaker_report():
+        print(line)
+    forecaster.save(LAG_HISTORY_FILE)
 
 if __name__ == "__main__":
     """
     Main execution block.
-    Example pipeline IDs are provided.
-    Replace them with actual pipeline IDs as needed.
+    Example pipeline IDs are provided in PIPELINE_IDS.
+    Replace them with actual pipeline IDs as needed, or pass a configuration file with --config.
     """
-    # Example pipeline IDs
-    pipeline_ids = [75, 63]  # You can add more pipelines here
-    main(pipeline_ids)
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Check Hevo pipeline lag and notify Slack.")
+    arg_parser.add_argument('--config', help="YAML or TOML configuration file to use instead of the constants above")
+    arg_parser.add_argument('--interval', type=float, default=0,
+                            help="Keep running, checking every INTERVAL seconds and reloading the configuration file when it changes")
+    arg_parser.add_argument('--no-deliver', action='store_true',
+                            help="Only queue the Slack messages, for a separate worker started with --deliver-only")
+    arg_parser.add_argument('--deliver-only', action='store_true',
+                            help="Only post the queued Slack messages and exit, or keep posting them with --interval")
+    args = arg_parser.parse_args()
+
+    reloader = ConfigReloader(args.config) if args.config else None
+    if reloader:
+        config = reloader.current()
+    worker = OutboxWorker(outbox, {'slack': deliver_slack})
+    if not (args.no_deliver or args.deliver_only):
+        worker.start()
+
+    while True:
+        if reloader:
+            config = reloader.current()
+        if args.deliver_only:
+            # Runs as the outbox's delivery worker, independently of the sweeps
+            worker.deliver_due()
+        else:
+            main(list(config.pipelines))
+
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+    if worker.thread:
+        queued = worker.stop(DRAIN_TIMEOUT)
+        if queued:
+            print(f"{queued} Slack messages are still queued in {OUTBOX_FILE} and will be retried on the next run")
\ No newline at end of file
@@ -5,7 +5,15 @@ File  : restart_multiple_objects.py
 Purpose:
 --------
 This script demonstrates a simple Python program that performs the basic operation of restarting
-multiple objects.
+multiple objects. With a configuration file, objects of several pipelines across Hevo regions and
+accounts are restarted in parallel and reported together.
+
+Instead of restarting every listed object, --status and --match page through each pipeline's
+objects and restart only those in the given statuses or matching a name pattern, e.g.
+
+    python restart_multiple_objects.py --status failed,paused --match 'employees.*' --dry-run
+
+Add --only-listed to keep the selection to the objects listed for the pipeline.
 
 Usage Documentation:
 ------
@@ -17,42 +25,215 @@ This script has no license. It is provided "as-is" without any warranty. Feel fr
 and modify it for any purpose.
 """
 
-import requests
+import argparse
+from fnmatch import fnmatchcase
+from instrumentation import timed
+from config_loader import compile_config, load_config
+from hevo_client import CircuitOpenError, breaker_report, client_for, sweep
+
+# Base URL and headers for the API request
+base_url = 'https://<region>.hevodata.com/api/public/v2.0'
+headers = {
+    "Authorization": "Basic <REPLACE_WITH_YOUR_TOKEN>"
+}
+
+# Pipeline and list of objects to restart when no configuration file is given
+PIPELINE_ID = 0  # Add your pipeline ID here
+OBJECTS = ["employees.harman_students", "employees.Harman_Fruit"]  # Add your object names here
+
+def default_config():
+    """
+    Builds the configuration from the constants above, used when no configuration file is given.
+
+    Returns:
+    Config: The compiled configuration.
+    """
+    return compile_config({
+        'regions': {'default': {'api_url': base_url, 'headers': headers}},
+        'restart': {'pipeline_id': PIPELINE_ID, 'objects': OBJECTS},
+    })
+
+# Active configuration, replaced by --config
+config = default_config()
 
-def restart_object(object_name):
+@timed()
+def restart_object(object_name, pipeline_id=None, client=None):
     """
     Restarts a given object by making a POST request to the Hevo API.
 
     Parameters:
     object_name (str): The name of the object to restart.
+    pipeline_id (int, optional): The pipeline of the object, defaults to the first configured pipeline.
+    client (HevoClient, optional): The client of the pipeline's region, defaults to the region of its restart target.
 
     Returns:
-    None
+    str: The response details of the restart request.
     """
-    # Define the API endpoint URL for the given object
-    url = f"https://<region>.hevodata.com/api/public/v2.0/pipelines/<id>/objects/{object_name}/restart"
-
-    # Define the headers with authorization
-    headers = {
-        "Authorization": "Basic <REPLACE_WITH_YOUR_TOKEN>"
-    }
+    if pipeline_id is None:
+        target = config.restarts[0]
+        pipeline_id = target.pipeline_id
+        client = client or client_for(config.region(target.region))
+    elif client is None:
+        # Pipeline IDs are per account, so use the region of the restart target listing the pipeline
+        target = next((target for target in config.restarts if target.pipeline_id == pipeline_id), None)
+        client = client_for(config.region(target.region if target else None))
 
     # Make the POST request to the API endpoint
-    response = requests.post(url, headers=headers)
+    response = client.post(f"pipelines/{pipeline_id}/objects/{object_name}/restart",
+                           endpoint="pipelines/{id}/objects/{name}/restart")
 
-    # Print response details for debugging
-    print(f"Object Name: {object_name}")
-    print("Status Code:", response.status_code)
-    print("Response Text:", response.text)
-    print("-" * 40)
+    # Response details for debugging
+    return (f"Region: {client.region.name}\n"
+            f"Pipeline ID: {pipeline_id}\n"
+            f"Object Name: {object_name}\n"
+            f"Status Code: {response.status_code}\n"
+            f"Response Text: {response.text}\n"
+            + "-" * 40)
+
+@timed()
+def list_objects(pipeline_id, client, page_size=100):
+    """
+    Pages through the objects of a pipeline.
+
+    Parameters:
+    pipeline_id (int): The ID of the pipeline.
+    client (HevoClient): The client of the pipeline's region.
+    page_size (int): The number of objects requested per page.
+
+    Returns:
+    list: The objects of the pipeline, as returned by the API.
+
+    Raises:
+    ValueError: If the API response does not contain the 'data' key.
+    """
+    objects = []
+    params = {'limit': page_size}
+    while True:
+        response = client.get(f"pipelines/{pipeline_id}/objects", endpoint="pipelines/{id}/objects", params=params)
+        response_data = response.json()
+        if 'data' not in response_data:
+            raise ValueError("API response does not contain 'data' key")
+
+        objects.extend(response_data['data'])
+        cursor = (response_data.get('pagination') or {}).get('starting_after')
+        if not response_data['data'] or not cursor:
+            return objects
+        params = {'limit': page_size, 'starting_after': cursor}
+
+def select_objects(objects, statuses=None, pattern=None, names=()):
+    """
+    Filters a pipeline's objects down to the ones that should be restarted.
+
+    Parameters:
+    objects (list): The objects returned by list_objects().
+    statuses (set, optional): Statuses to keep, e.g. {'FAILED', 'PAUSED'}, compared case-insensitively.
+    pattern (str, optional): Shell-style pattern the object name must match, e.g. 'employees.*'.
+    names (tuple, optional): If not empty, only these object names are kept.
+
+    Returns:
+    list: (object name, status) pairs of the selected objects.
+    """
+    selected = []
+    for obj in objects:
+        name = obj.get('name')
+        if not name:
+            continue  # Nothing to restart by
+        status = str(obj.get('status', '')).upper()
+        if statuses and status not in statuses:
+            continue
+        if pattern and not fnmatchcase(name, pattern):
+            continue
+        if names and name not in names:
+            continue
+        selected.append((name, status))
+    return selected
+
+def positive_int(value):
+    """
+    Parses a command line value that must be an integer of at least 1.
+
+    Parameters:
+    value (str): The command line value.
+
+    Returns:
+    int: The parsed number.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got '{value}'")
+    return number
+
+def main(restarts, statuses=None, pattern=None, dry_run=False, workers=None, only_listed=False):
+    """
+    Restarts the objects of every target, sweeping all regions in parallel.
+
+    Parameters:
+    restarts (list): The RestartTarget entries of the configuration.
+    statuses (set, optional): Only restart objects in these statuses, listed from the API.
+    pattern (str, optional): Only restart objects whose name matches this pattern, listed from the API.
+    dry_run (bool): Only report the objects that would be restarted.
+    workers (int, optional): Maximum number of parallel restarts per region, at least 1.
+    only_listed (bool): With statuses or pattern, only consider the objects listed for each target.
+
+    Returns:
+    str: The merged report of every restart, in configuration order.
+    """
+    if workers is not None and workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    if statuses or pattern:
+        # Page through each pipeline's objects, all pipelines in parallel, and keep the matching ones
+        def select(target, client):
+            try:
+                names = target.objects if only_listed else ()
+                return select_objects(list_objects(target.pipeline_id, client), statuses, pattern, names)
+            except Exception as e:
+                print(f"Failed to list the objects of pipeline {target.pipeline_id}: {e}")
+                return []
+
+        selections = sweep(config, restarts, lambda target: target.region, select, workers)
+        items = [(target, name) for target, selected in zip(restarts, selections) for name, status in selected]
+        if dry_run:
+            lines = [f"Would restart {name} ({status}) of pipeline {target.pipeline_id} in region {target.region}"
+                     for target, selected in zip(restarts, selections) for name, status in selected]
+            return "\n".join(lines + [f"{len(lines)} objects would be restarted"] + breaker_report())
+    else:
+        items = [(target, object_name) for target in restarts for object_name in target.objects]
+        if dry_run:
+            lines = [f"Would restart {name} of pipeline {target.pipeline_id} in region {target.region}"
+                     for target, name in items]
+            return "\n".join(lines + [f"{len(lines)} objects would be restarted"])
+
+    def restart(item, client):
+        target, object_name = item
+        try:
+            return restart_object(object_name, target.pipeline_id, client)
+        except CircuitOpenError:
+            return f"Skipped {object_name} of pipeline {target.pipeline_id}: circuit open\n" + "-" * 40
+        except Exception as e:
+            return f"Failed to restart {object_name} of pipeline {target.pipeline_id}: {e}\n" + "-" * 40
+
+    report = sweep(config, items, lambda item: item[0].region, restart, workers)
+    return "\n".join(report + breaker_report())
 
 if __name__ == "__main__":
     """
     Main execution block to restart a list of objects.
     """
-    # List of objects to restart
-    objects = ["employees.harman_students", "employees.Harman_Fruit"]  # Add your object names here 
+    arg_parser = argparse.ArgumentParser(description="Restart a list of objects of a Hevo pipeline.")
+    arg_parser.add_argument('--config', help="YAML or TOML configuration file to use instead of the constants above")
+    arg_parser.add_argument('--status', help="Only restart objects in these statuses, comma separated, e.g. failed,paused")
+    arg_parser.add_argument('--match', help="Only restart objects whose name matches this pattern, e.g. 'employees.*'")
+    arg_parser.add_argument('--dry-run', action='store_true', help="Show which objects would be restarted without restarting them")
+    arg_parser.add_argument('--only-listed', action='store_true',
+                            help="With --status or --match, only consider the objects listed in the configuration")
+    arg_parser.add_argument('--workers', type=positive_int, help="Maximum number of parallel restarts per region")
+    args = arg_parser.parse_args()
+    if args.config:
+        config = load_config(args.config)
+    statuses = {status.strip().upper() for status in args.status.split(',') if status.strip()} if args.status else None
 
-    # Restart each object in a loop
-    for obj in objects:
-        restart_object(obj)
\ No newline at end of file
+    # Restart the selected objects and print the merged report
+    print(main(config.restarts, statuses, args.match, args.dry_run, args.workers, args.only_listed))
\ No newline at end of file
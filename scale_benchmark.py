@@ -0,0 +1,297 @@
+"""
+Author: Hevo
+File  : scale_benchmark.py
+
+Purpose:
+--------
+This script benchmarks the scripts in this repository against the local Hevo API simulator
+(hevo_api_simulator.py) at increasing scale, so that performance changes can be measured and
+compared reproducibly without a Hevo account. Each scenario runs in a fresh Python process and
+reports its wall time, the number of API requests it made and its peak resident memory:
+
+    lag-email   gmail_lag_alert_notification.py: check N pipelines, route and render the digests
+    lag-slack   postgres_alert_notification.py: check N pipelines, queue and post Slack messages for the lagging ones
+    restart     restart_multiple_objects.py: list a pipeline of N objects and restart the failed and paused ones
+    models      run_multiple_models.py: trigger N models, consulting the run ledger and model status
+    startup     magic_scripts.py: start Python processes that load the entry point and parse a subcommand, and
+                that load the lag, restart and run-models scripts for their --help, once whatever the sizes;
+                fails if a heavy dependency (BigQuery, MySQL, ...) is loaded before it is needed
+
+    python scale_benchmark.py                                   # every scenario at 10, 1k and 10k entities
+    python scale_benchmark.py --scenarios restart --sizes 1000 --latency 20
+    python scale_benchmark.py --output after.json --baseline before.json
+
+No emails are sent; the email scenario stops at the rendered digests.
+
+Usage Documentation:
+--------------------
+https://api-docs.hevodata.com/reference/introduction
+
+License:
+--------
+This script has no license. It is provided "as-is" without any warranty. Feel free to use
+and modify it for any purpose.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from hevo_api_simulator import HevoApiSimulator, SimulatorSettings
+
+SCENARIOS = ['startup', 'lag-email', 'lag-slack', 'restart', 'models']
+SIZES = [10, 1000, 10000]
+CONCURRENCY = 8                 # Parallel requests per region, as configured in the regions section
+SEED = 0                        # Seed of the simulator, so runs see the same errors and jitter
+
+# Modules that magic_scripts.py must not import before a subcommand needs them
+HEAVY_MODULES = ['google.cloud.bigquery', 'mysql.connector', 'dateutil', 'pytz', 'smtplib', 'requests']
+# Modules that only sync-columns needs, so loading any of these subcommands must not import them
+SCRIPT_HEAVY_MODULES = ['google.cloud.bigquery', 'mysql.connector']
+STARTUP_COMMANDS = [['lag'], ['lag', '--via', 'outlook'], ['lag', '--via', 'slack'], ['restart'], ['run-models']]
+
+# Run in a fresh process: parse a subcommand, or run one for its --help, then report the loaded modules
+STARTUP_CODE = """\
+import contextlib, io, json, sys
+import magic_scripts
+command = sys.argv[1:]
+with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+    if command:
+        magic_scripts.main([*command, '--help'])
+    else:
+        magic_scripts.build_parser().parse_known_args(['lag', '--via', 'slack', '--config', 'config.toml'])
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def _config(api_url, slack_webhook_url, concurrency, **raw):
+    from config_loader import compile_config
+    return compile_config({
+        'regions': {'local': {'api_url': api_url, 'token': 'benchmark', 'concurrency': concurrency}},
+        'slack_webhook_url': slack_webhook_url,
+        'timezones': {'IST': 5.5},
+        **raw,
+    })
+
+
+def _run_startup(size, api_url, slack_webhook_url, concurrency):
+    # Cold starts, as from cron: the entry point alone, then the script of each subcommand
+    for command in [[], *STARTUP_COMMANDS]:
+        completed = subprocess.run([sys.executable, '-c', STARTUP_CODE, *command], capture_output=True, text=True,
+                                   check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        modules = set(json.loads(completed.stdout))
+        loaded = [name for name in (SCRIPT_HEAVY_MODULES if command else HEAVY_MODULES) if name in modules]
+        if loaded:
+            where = f"'{' '.join(command)} --help'" if command else "startup"
+            raise RuntimeError(f"magic_scripts.py imports {', '.join(loaded)} at {where}")
+
+
+def _run_lag_email(size, api_url, slack_webhook_url, concurrency):
+    import gmail_lag_alert_notification as script
+    from email_templates import render_html_digest
+    from notification_routing import render_text_body, route_checks
+
+    script.LAG_HISTORY_FILE = os.path.abspath('gmail_lag_history.json')
+    script.config = _config(api_url, slack_webhook_url, concurrency, pipelines=list(range(1, size + 1)),
+                            recipients={'oncall@example.com': []})
+    checks = script.main(list(script.config.pipelines))
+    for primary, routed in route_checks(checks, script.config).items():
+        render_text_body(routed, "Pipeline lag report")
+        render_html_digest(routed, script.forecaster, "Pipeline lag report")
+
+
+def _run_lag_slack(size, api_url, slack_webhook_url, concurrency):
+    import postgres_alert_notification as script
+    from outbox import Outbox, OutboxWorker
+
+    script.LAG_HISTORY_FILE = os.path.abspath('postgres_lag_history.json')
+    script.outbox = Outbox(os.path.abspath('postgres_outbox.sqlite'))
+    script.config = _config(api_url, slack_webhook_url, concurrency, pipelines=list(range(1, size + 1)))
+    script.main(list(script.config.pipelines))
+    OutboxWorker(script.outbox, {'slack': script.deliver_slack}).deliver_due()
+    script.outbox.close()
+
+
+def _run_restart(size, api_url, slack_webhook_url, concurrency):
+    import restart_multiple_objects as script
+
+    script.config = _config(api_url, slack_webhook_url, concurrency, restart={'pipeline_id': 1})
+    script.main(script.config.restarts, statuses={'FAILED', 'PAUSED'})
+
+
+def _run_models(size, api_url, slack_webhook_url, concurrency):
+    import run_multiple_models as script
+
+    script.config = _config(api_url, slack_webhook_url, concurrency, models={'ids': list(range(1, size + 1))})
+    ledger = script.RunLedger(os.path.abspath('model_runs.sqlite'))
+    try:
+        script.main(script.config.model_targets, ledger)
+    finally:
+        ledger.close()
+
+
+RUNNERS = {
+    'startup': _run_startup,
+    'lag-email': _run_lag_email,
+    'lag-slack': _run_lag_slack,
+    'restart': _run_restart,
+    'models': _run_models,
+}
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident memory of this process, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scenario(scenario, size, api_url, slack_webhook_url, concurrency):
+    """
+    Run one scenario in this process, from a scratch directory and with its output discarded.
+    Called in the child process started by benchmark().
+
+    Returns:
+    --------
+    dict
+        Wall time, including the scenario's imports, and peak memory.
+    """
+    started = time.perf_counter()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(io.StringIO()):
+        os.chdir(workdir)
+        try:
+            RUNNERS[scenario](size, api_url, slack_webhook_url, concurrency)
+        finally:
+            os.chdir(cwd)
+    return {'wall_seconds': round(time.perf_counter() - started, 4), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+
+
+def benchmark(simulator, scenario, size, concurrency):
+    """
+    Run one scenario at one size in a fresh Python process against the simulator.
+
+    Parameters:
+    -----------
+    simulator : HevoApiSimulator
+        The running simulator.
+    scenario : str
+        One of SCENARIOS.
+    size : int
+        Number of pipelines, objects or models.
+    concurrency : int
+        Parallel requests per region.
+
+    Returns:
+    --------
+    dict
+        The scenario, size, wall time, request count, requests per second and peak memory.
+    """
+    simulator.settings.objects_per_pipeline = size
+    simulator.reset()
+    command = [sys.executable, os.path.abspath(__file__), '--child', scenario, str(size),
+               simulator.api_url, simulator.slack_webhook_url, str(concurrency)]
+    completed = subprocess.run(command, capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if completed.returncode:
+        raise RuntimeError(f"Scenario {scenario} at {size} failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    requests_made = simulator.stats()['requests']
+    return {
+        'scenario': scenario,
+        'size': size,
+        'wall_seconds': result['wall_seconds'],
+        'requests': requests_made,
+        'requests_per_second': round(requests_made / result['wall_seconds'], 1) if result['wall_seconds'] else None,
+        'peak_rss_mb': result['peak_rss_mb'],
+    }
+
+
+def compare(results, baseline, max_regression=None):
+    """
+    Print how the results compare to a baseline run.
+
+    Parameters:
+    -----------
+    results : list of dict
+        The results of this run.
+    baseline : list of dict
+        The results of an earlier run, as saved with --output.
+    max_regression : float, optional
+        Largest allowed relative increase of wall time, e.g. 0.2 for 20%.
+
+    Returns:
+    --------
+    list of str
+        The scenarios that regressed by more than max_regression.
+    """
+    previous = {(result['scenario'], result['size']): result for result in baseline}
+    regressions = []
+    print(f"\n{'scenario':<10} {'size':>6} {'wall':>10} {'requests':>10} {'peak RSS':>10}")
+    for result in results:
+        before = previous.get((result['scenario'], result['size']))
+        if not before:
+            continue
+        wall = result['wall_seconds'] / before['wall_seconds'] - 1 if before['wall_seconds'] else 0.0
+        requests_made = result['requests'] - before['requests']
+        rss = result['peak_rss_mb'] / before['peak_rss_mb'] - 1 if before['peak_rss_mb'] else 0.0
+        print(f"{result['scenario']:<10} {result['size']:>6} {wall:>+10.1%} {requests_made:>+10} {rss:>+10.1%}")
+        if max_regression is not None and wall > max_regression:
+            regressions.append(f"{result['scenario']} at {result['size']}: wall time {wall:+.1%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        scenario, size, api_url, slack_webhook_url, concurrency = sys.argv[2:7]
+        print(json.dumps(run_scenario(scenario, int(size), api_url, slack_webhook_url, int(concurrency))))
+        sys.exit(0)
+
+    arg_parser = argparse.ArgumentParser(description="Benchmark the scripts against the simulated Hevo API.")
+    arg_parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help="Scenarios to run, comma separated (default: %(default)s)")
+    arg_parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                            help="Numbers of pipelines, objects or models, comma separated (default: %(default)s)")
+    arg_parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                            help="Parallel requests per region (default: %(default)s)")
+    arg_parser.add_argument('--latency', type=float, default=0, help="Milliseconds the simulator adds to every response")
+    arg_parser.add_argument('--error-rate', type=float, default=0,
+                            help="Share of API and webhook requests answered with a 500")
+    arg_parser.add_argument('--throttle-rate', type=float, default=0,
+                            help="Share of API and webhook requests answered with a 429")
+    arg_parser.add_argument('--output', help="Save the results to this JSON file")
+    arg_parser.add_argument('--baseline', help="Compare the results with a JSON file saved by an earlier run")
+    arg_parser.add_argument('--max-regression', type=float,
+                            help="With --baseline, exit with an error if a wall time grew by more than this share, e.g. 0.2")
+    args = arg_parser.parse_args()
+
+    settings = SimulatorSettings(latency=args.latency / 1000, error_rate=args.error_rate,
+                                 throttle_rate=args.throttle_rate, seed=SEED)
+    results = []
+    with HevoApiSimulator(settings) as simulator:
+        print(f"{'scenario':<10} {'size':>6} {'wall (s)':>10} {'requests':>10} {'req/s':>10} {'peak RSS (MB)':>14}")
+        for scenario in args.scenarios.split(','):
+            sizes = [1] if scenario == 'startup' else [int(size) for size in args.sizes.split(',')]
+            for size in sizes:
+                result = benchmark(simulator, scenario, size, args.concurrency)
+                results.append(result)
+                print(f"{scenario:<10} {size:>6} {result['wall_seconds']:>10.3f} {result['requests']:>10} "
+                      f"{result['requests_per_second'] or 0:>10.1f} {result['peak_rss_mb']:>14.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            sys.exit("Performance regressions:\n" + "\n".join(regressions))